@@ -1,50 +1,32 @@
-import pyvisa
-
-rm = pyvisa.ResourceManager()
-rm.list_resources_info()
-
-def exisiting_tool(lab_num,tool,soccet_num):
-    fung = rm.open_resource("TCPIP::nano-slab-"+str(lab_num)+"-"+tool+".uio.no::"+str(soccet_num)+"::SOCKET")
-    fung.read_termination = '\n'
-    if(tool == "gpp"):
-        pass 
+import argparse
+import time
+
+from instruments import LABS, PORTS, Session, discover, save_inventory, INVENTORY
+
+# The power supply of lab 5 is not connected
+SKIP = {(5, "gpp")}
+
+if (__name__ == "__main__"):
+    parser = argparse.ArgumentParser(
+        description="Checking which tools are available at every lab space"
+    )
+    parser.add_argument("--timeout", type=int, default=1000, help="Per tool deadline in ms")
+    parser.add_argument("--sequential", action="store_true", help="Open the tools one after another")
+    args = parser.parse_args()
+
+    if args.sequential:
+        for lab_num in LABS:
+            print("Lab "+str(lab_num)+":")
+            session = Session(lab_num, inventory={})
+            for tool in PORTS:
+                if (lab_num, tool) not in SKIP:
+                    session.get(tool)
+            session.close()
     else:
-        fung.write_termination = '\n'
-    print(fung.query('*IDN?'))
-
-print("Lab 1:")
-exisiting_tool(1,"mdo",3000) #oscilloscope
-exisiting_tool(1,"mfg",1026) #function generator
-exisiting_tool(1,"gdm",3001) #multi meter
-exisiting_tool(1,"gpp",1026) #power supply
-
-print("Lab 2:")
-exisiting_tool(2,"mdo",3000) #oscilloscope
-exisiting_tool(2,"mfg",1026) #function generator
-exisiting_tool(2,"gdm",3001) #multi meter
-exisiting_tool(2,"gpp",1026) #power supply
-
-print("Lab 3:")
-exisiting_tool(3,"mdo",3000) #oscilloscope
-exisiting_tool(3,"mfg",1026) #function generator
-exisiting_tool(3,"gdm",3001) #multi meter
-exisiting_tool(3,"gpp",1026) #power supply
-
-print("Lab 4:")
-exisiting_tool(4,"mdo",3000) #oscilloscope
-exisiting_tool(4,"mfg",1026) #function generator
-exisiting_tool(4,"gdm",3001) #multi meter
-exisiting_tool(4,"gpp",1026) #power supply
-
-print("Lab 5:")
-exisiting_tool(5,"mdo",3000) #oscilloscope
-exisiting_tool(5,"mfg",1026) #function generator
-exisiting_tool(5,"gdm",3001) #multi meter
-#exisiting_tool(5,"gpp",1026) #power supply
-
-print("Lab 6:")
-exisiting_tool(6,"mdo",3000) #oscilloscope
-exisiting_tool(6,"mfg",1026) #function generator
-exisiting_tool(6,"gdm",3001) #multi meter
-exisiting_tool(6,"gpp",1026) #power supply
-
+        start = time.perf_counter()
+        inventory = discover(timeout=args.timeout)
+        for entry in inventory.values():
+            status = entry["idn"] if entry["reachable"] else "not reachable"
+            print(f"Lab {entry['lab_num']} {entry['tool']}: {status} ({entry['latency']*1e3:.0f} ms)")
+        save_inventory(inventory)
+        print(f"Scanned {len(inventory)} tools in {time.perf_counter()-start:.2f} s, saved to {INVENTORY}")
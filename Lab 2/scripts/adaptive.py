@@ -0,0 +1,80 @@
+import numpy as np
+
+
+def crossing(frequencies, values, level):
+    """Frequency where values first cross level, interpolated in log frequency."""
+    above = values >= level
+    index = np.flatnonzero(above[:-1] != above[1:])
+    if index.size == 0:
+        return None
+    i = index[0]
+    x = np.log10(frequencies[i:i+2])
+    fraction = (level - values[i]) / (values[i+1] - values[i])
+    return 10**(x[0] + fraction * (x[1] - x[0]))
+
+
+def margins(frequencies, gain, phase):
+    """Unity gain frequency and phase margin, None where there is no crossing."""
+    unity_gain_freq = crossing(frequencies, gain, 0.0)
+    if unity_gain_freq is None:
+        return None, None
+    phase_margin = 180 + np.interp(np.log10(unity_gain_freq), np.log10(frequencies), phase)
+    return unity_gain_freq, phase_margin
+
+
+def intervals_to_split(frequencies, gain, phase, curvature_tol, min_ratio):
+    x = np.log10(frequencies)
+    wide = frequencies[1:] / frequencies[:-1] > min_ratio
+    split = np.zeros(x.size - 1, dtype=bool)
+    # Brackets of the 0 dB and -180 degree crossings
+    for values, level in ((gain, 0.0), (phase, -180.0)):
+        above = values >= level
+        split |= above[:-1] != above[1:]
+    # Intervals next to points where the curve bends, per decade squared
+    if x.size > 2:
+        for values, scale in ((gain, 20.0), (phase, 90.0)):
+            slope = np.diff(values) / np.diff(x) / scale
+            bend = np.abs(np.diff(slope)) / ((x[2:] - x[:-2]) / 2)
+            high = bend > curvature_tol
+            split[:-1] |= high
+            split[1:] |= high
+    return np.flatnonzero(split & wide)
+
+
+def adaptive_sweep(measure, frequency_min, frequency_max, initial_points=5, max_points=50,
+                   ugf_tol=0.01, pm_tol=0.5, curvature_tol=1.0, min_ratio=1.02):
+    """Place Bode points where they matter for the stability margins.
+
+    Starts from a coarse log grid and keeps bisecting (in log frequency) the
+    intervals around the 0 dB and -180 degree crossings and where gain or
+    phase bend sharply, until the unity gain frequency changes less than
+    ugf_tol (relative) and the phase margin less than pm_tol degrees between
+    rounds, or max_points is reached.
+
+    measure(freq) returns (vpp_in, vpp_out, phase), possibly followed by
+    more values that are left alone. Returns the sorted
+    frequencies, vpp_in, vpp_out and phase arrays.
+    """
+    points = {}
+    for freq in np.logspace(np.log10(frequency_min), np.log10(frequency_max), initial_points):
+        points[freq] = measure(freq)
+    previous = (None, None)
+    while True:
+        frequencies = np.array(sorted(points))
+        vpp_in, vpp_out, phase = np.array([points[f][:3] for f in frequencies]).T
+        gain = 20 * np.log10(vpp_out / vpp_in)
+        phase = np.unwrap(phase, period=360)
+        unity_gain_freq, phase_margin = margins(frequencies, gain, phase)
+        if (unity_gain_freq is not None and previous[0] is not None
+                and abs(unity_gain_freq - previous[0]) <= ugf_tol * previous[0]
+                and abs(phase_margin - previous[1]) <= pm_tol):
+            break
+        previous = (unity_gain_freq, phase_margin)
+        split = intervals_to_split(frequencies, gain, phase, curvature_tol, min_ratio)
+        if split.size == 0 or len(points) >= max_points:
+            break
+        for i in split[:max_points - len(points)]:
+            freq = np.sqrt(frequencies[i] * frequencies[i+1])
+            points[freq] = measure(freq)
+    print(f'Adaptive sweep: {len(points)} points, unity gain frequency {unity_gain_freq}, phase margin {phase_margin}')
+    return frequencies, vpp_in, vpp_out, phase
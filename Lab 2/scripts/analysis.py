@@ -0,0 +1,134 @@
+from collections import namedtuple
+
+import numpy as np
+
+Response = namedtuple("Response", "vpp_in vpp_out gain_db phase thd")
+# overshoot as a fraction of the step, phase_margin in degrees
+StepResponse = namedtuple("StepResponse", "overshoot ringing_frequency settling_time damping phase_margin")
+
+
+def sine_fit(t, y, frequency, harmonics=1):
+    """Least squares fit of a sine at a known frequency and its harmonics.
+
+    t and y have shape (..., n) and frequency broadcasts against the
+    leading dimensions, so a whole batch of captures is fitted at once.
+    Returns the complex amplitude of each harmonic, shape (..., harmonics),
+    and the DC offset.
+    """
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    wt = 2 * np.pi * np.asarray(frequency, dtype=float)[..., None] * t
+    k = np.arange(1, harmonics + 1)
+    kwt = wt[..., :, None] * k
+    A = np.concatenate([np.cos(kwt), np.sin(kwt), np.ones(kwt.shape[:-1] + (1,))], axis=-1)
+    A, y = np.broadcast_arrays(A, y[..., None])
+    y = y[..., 0]
+    coef = np.linalg.solve(np.einsum('...ni,...nj->...ij', A, A), np.einsum('...ni,...n->...i', A, y)[..., None])[..., 0]
+    # a*cos(wt) + b*sin(wt) = Re((a - jb) * exp(jwt))
+    phasors = coef[..., :harmonics] - 1j * coef[..., harmonics:2*harmonics]
+    return phasors, coef[..., -1]
+
+
+def lock_in(t, y, frequency):
+    """Digital lock-in: complex amplitude of y at frequency.
+
+    Only unbiased over an integer number of periods, use sine_fit otherwise.
+    """
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    reference = np.exp(-2j * np.pi * np.asarray(frequency, dtype=float)[..., None] * t)
+    return 2 * np.mean((y - y.mean(axis=-1, keepdims=True)) * reference, axis=-1)
+
+
+def thd(phasors):
+    return np.sqrt(np.sum(np.abs(phasors[..., 1:])**2, axis=-1)) / np.abs(phasors[..., 0])
+
+
+def gain_phase(t, v_in, v_out, frequency, harmonics=5):
+    """Amplitude ratio, phase and THD of v_out relative to v_in.
+
+    Phase is in degrees, negative when the output lags the input.
+    """
+    p_in, _ = sine_fit(t, v_in, frequency, harmonics)
+    p_out, _ = sine_fit(t, v_out, frequency, harmonics)
+    h = p_out[..., 0] / p_in[..., 0]
+    return Response(
+        vpp_in=2 * np.abs(p_in[..., 0]),
+        vpp_out=2 * np.abs(p_out[..., 0]),
+        gain_db=20 * np.log10(np.abs(h)),
+        phase=np.degrees(np.angle(h)),
+        thd=thd(p_out),
+    )
+
+
+def damping_from_overshoot(overshoot):
+    """Damping ratio of the second order system that overshoots by this fraction."""
+    log = np.log(np.clip(overshoot, 1e-12, None))
+    return np.where(np.asarray(overshoot) > 0, -log / np.sqrt(np.pi**2 + log**2), 1.0)
+
+
+def phase_margin(damping):
+    """Phase margin in degrees of a unity feedback loop whose closed loop is
+    second order with this damping ratio."""
+    z = np.asarray(damping, dtype=float)
+    return np.degrees(np.arctan(2 * z / np.sqrt(np.sqrt(1 + 4 * z**4) - 2 * z**2)))
+
+
+def ringing_fit(t, error, frequency, decay, points=32):
+    """Least squares fit of exp(-decay*t) * (a*cos(2*pi*f*t) + b*sin(2*pi*f*t)).
+
+    Every (f, decay) on a grid around the guesses is fitted at once, a and b
+    solved in closed form. Returns the frequency and decay of the best one.
+    """
+    f = (frequency * np.geomspace(0.7, 1.4, points))[:, None, None]
+    d = (decay * np.geomspace(0.25, 4, points))[None, :, None]
+    envelope = np.exp(-d * t)
+    c = envelope * np.cos(2 * np.pi * f * t)
+    s = envelope * np.sin(2 * np.pi * f * t)
+    cc, ss, cs = (c * c).sum(-1), (s * s).sum(-1), (c * s).sum(-1)
+    ce, se = (c * error).sum(-1), (s * error).sum(-1)
+    det = cc * ss - cs**2
+    a = (ss * ce - cs * se) / det
+    b = (cc * se - cs * ce) / det
+    # Residual sum of squares less the constant sum(error**2)
+    residual = -(a * ce + b * se)
+    i, j = np.unravel_index(np.nanargmin(residual), residual.shape)
+    return f[i, 0, 0], d[0, j, 0]
+
+
+def step_metrics(t, v, band=0.02, fit_points=2000):
+    """Overshoot, ringing and settling of a step captured with the edge at t = 0.
+
+    The level before the edge and the mean of the last fifth of the record
+    are the start and end of the step. The settling time is the last time
+    the output is more than band away from the end. Damping and phase margin
+    come from the ringing, from the overshoot if there is too little of it.
+    Without ringing the phase margin is a lower bound.
+    """
+    t = np.asarray(t, dtype=float)
+    v = np.asarray(v, dtype=float)
+    before, after = v[t < 0], t >= 0
+    start = np.median(before[-max(before.size // 4, 1):])
+    tail = v[after][-max(after.sum() // 5, 1):]
+    y = (v[after] - start) / (tail.mean() - start)
+    ta = t[after]
+    # A short moving average keeps the noise out of the peak and the band
+    window = np.ones(max(y.size // 200, 1))
+    smooth = np.convolve(y, window, mode="same") / np.convolve(np.ones(y.size), window, mode="same")
+    overshoot = max(smooth.max() - 1, 0.0)
+    outside = np.flatnonzero(np.abs(smooth - 1) > band)
+    settling_time = ta[outside[-1]] if outside.size else 0.0
+
+    # Overshoot within the noise counts as none, critically damped
+    damping = float(damping_from_overshoot(overshoot)) if overshoot > band / 2 else 1.0
+    ringing_frequency = np.nan
+    peak = np.argmax(smooth)
+    if overshoot > band and ta[peak] > 0:
+        # A second order step response peaks half a ringing period after the edge
+        frequency = 1 / (2 * ta[peak])
+        decay = 2 * np.pi * frequency * damping / np.sqrt(1 - damping**2)
+        step = max((ta.size - peak) // fit_points, 1)
+        tf = ta[peak::step] - ta[peak]
+        ringing_frequency, decay = ringing_fit(tf, y[peak::step] - 1, frequency, decay)
+        damping = decay / np.hypot(decay, 2 * np.pi * ringing_frequency)
+    return StepResponse(overshoot, ringing_frequency, settling_time, damping, float(phase_margin(damping)))
@@ -0,0 +1,83 @@
+"""Repeat noisy readings until their mean is known well enough.
+
+Readings are added until the half width of the confidence interval of the
+mean of every quantity is within its target, or the reading budget runs
+out. A quiet point stops after the first few readings and a noisy one gets
+as many as it needs, instead of every point getting the same guessed
+repeat count.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+# Per quantity: mean, standard deviation of the readings and half width of
+# the confidence interval of the mean. count readings of each.
+Estimate = namedtuple("Estimate", "mean std count ci")
+
+
+def t_within(t, dof):
+    """P(|T| < t) for Student's t with an integer number of degrees of freedom.
+
+    The closed form of Abramowitz and Stegun 26.7.3 and 26.7.4.
+    """
+    theta = math.atan(t / math.sqrt(dof))
+    c2 = math.cos(theta)**2
+    term = total = 1.0
+    if dof % 2:
+        for k in range(1, (dof - 1) // 2):
+            term *= c2 * 2 * k / (2 * k + 1)
+            total += term
+        return 2 / math.pi * (theta + (math.sin(theta) * math.cos(theta) * total if dof > 1 else 0.0))
+    for k in range(1, dof // 2):
+        term *= c2 * (2 * k - 1) / (2 * k)
+        total += term
+    return math.sin(theta) * total
+
+
+def t_quantile(confidence, dof):
+    """Two sided Student t quantile, t_within() solved by bisection.
+
+    Exact to 1e-9 for any integer dof. The few readings of a quiet point
+    are where the normal approximations are furthest off.
+    """
+    low, high = 0.0, 1.0
+    while t_within(high, dof) < confidence:
+        low, high = high, 2 * high
+    while high - low > 1e-9 * high:
+        middle = (low + high) / 2
+        if t_within(middle, dof) < confidence:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def estimate(readings, confidence=0.95):
+    """Estimate from an array of readings shaped (count, quantities)."""
+    readings = np.asarray(readings, dtype=float)
+    count = readings.shape[0]
+    std = readings.std(axis=0, ddof=1) if count > 1 else np.full(readings.shape[1], np.inf)
+    ci = t_quantile(confidence, max(count - 1, 1)) * std / np.sqrt(count)
+    return Estimate(readings.mean(axis=0), std, count, ci)
+
+
+def collect(read, targets, confidence=0.95, min_count=3, max_count=32):
+    """Read until the confidence interval of every quantity is within target.
+
+    read() returns one reading per quantity, or an array (k, quantities) of
+    k readings at once like a block from the GDM. targets holds the largest
+    acceptable half width per quantity, None for quantities that are only
+    averaged. Stops after max_count readings whatever the intervals.
+    """
+    readings = []
+    while True:
+        readings.extend(np.atleast_2d(np.asarray(read(), dtype=float)))
+        if len(readings) < min_count:
+            continue
+        result = estimate(readings, confidence)
+        if all(target is None or ci <= target for target, ci in zip(targets, result.ci)):
+            return result
+        if len(readings) >= max_count:
+            print(f'Confidence target not reached in {len(readings)} readings: +-{result.ci}')
+            return result
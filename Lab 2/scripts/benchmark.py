@@ -0,0 +1,135 @@
+"""Throughput benchmark for the DC, stepped Bode and MFG hardware sweeps.
+
+Each sweep runs against the real bench or the simulated one (--sim) and
+the wall time is split into instrument I/O, explicit sleeps and the rest
+(analysis and Python overhead). One JSON line per sweep is appended to
+--output so runs of different versions can be compared.
+"""
+import argparse
+import json
+import os
+import subprocess
+import time
+
+import numpy as np
+
+from instruments import Session
+import read_waveform_mdo
+from tracing import Tracer
+import voltage_sweep_AC
+import voltage_sweep_DC
+
+
+def run_dc(session, args):
+    sweep_args = voltage_sweep_DC.build_parser().parse_args([
+        "--slab_num", str(args.slab_num), "--output_port", "1",
+        "--voltage_min", "0", "--voltage_max", str(args.dc_points - 1), "--voltage_step", "1",
+    ])
+    set_values, _ = voltage_sweep_DC.dc_sweep(session.gpp, session.gdm, sweep_args)
+    return len(set_values)
+
+
+def bode_args(args, local):
+    sweep_args = read_waveform_mdo.build_parser().parse_args([
+        "--slab_num", str(args.slab_num), "--mfg_output_port", "1",
+        "--mdo_input_port_in", "1", "--mdo_input_port_out", "2",
+        "--frequency_min", "100", "--frequency_max", "1e6", "--num_points", str(args.bode_points),
+        "--amplitude", "0.01", "--offset", "0",
+    ])
+    sweep_args.local = local
+    return sweep_args
+
+
+def run_bode(session, args, local=False):
+    sweep_args = bode_args(args, local)
+    read_waveform_mdo.configure(session.mfg, session.mdo, sweep_args)
+    frequencies = np.logspace(2, 6, sweep_args.num_points)
+    vpp_in, vpp_out, phase_shift = read_waveform_mdo.bode_sweep(session.mfg, session.mdo, frequencies, sweep_args)
+    gain = np.array(read_waveform_mdo.calculate_gain(vpp_in, vpp_out))
+    read_waveform_mdo.stability(frequencies, gain, np.array(phase_shift))
+    return len(frequencies)
+
+
+def run_hardware(session, args):
+    sweep_args = voltage_sweep_AC.build_parser().parse_args([
+        "--slab_num", str(args.slab_num), "--mfg_output_port", "1",
+        "--mdo_input_port_in", "1", "--mdo_input_port_out", "2",
+        "--start_frequency", "100", "--stop_frequency", "1e6", "--sweep_time", str(args.sweep_time),
+        "--amplitude", "0.01", "--offset", "0",
+    ])
+    phase_shift = voltage_sweep_AC.hardware_sweep(session.mfg, session.mdo, sweep_args)[-1]
+    return len(phase_shift)
+
+
+SWEEPS = {
+    "dc": run_dc,
+    "bode": run_bode,
+    "bode_local": lambda session, args: run_bode(session, args, local=True),
+    "hardware": run_hardware,
+}
+
+
+def version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(name, session, args, tracer):
+    # Open every tool first so connecting is not timed
+    for tool in ("mfg", "mdo", "gdm", "gpp"):
+        tracer.attach(session.get(tool))
+    start = time.perf_counter()
+    with tracer.sleeps():
+        points = SWEEPS[name](session, args)
+    wall = time.perf_counter() - start
+    io, sleep = tracer.total("io"), tracer.total("sleep")
+    analysis = wall - io - sleep
+    return {
+        "sweep": name,
+        "version": version(),
+        "backend": f"sim:{args.sim}" if args.sim else f"slab{args.slab_num}",
+        "time": time.time(),
+        "points": points,
+        "commands": tracer.count("io"),
+        "skipped_writes": sum(session.get(tool).skipped for tool in ("mfg", "mdo", "gdm", "gpp")),
+        "wall": wall,
+        "points_per_second": points / wall,
+        "per_point": {"io": io / points, "sleep": sleep / points, "analysis": analysis / points},
+    }
+
+
+if (__name__ == "__main__"):
+    parser = argparse.ArgumentParser(description="Benchmark the sweep throughput")
+    parser.add_argument("--slab_num", type=int, default=1, help="Lab space number between 1 and 6")
+    parser.add_argument("--sim", nargs="?", const="default", help="Use the simulated bench, optionally configured by a JSON file")
+    parser.add_argument("--sweeps", nargs="+", default=list(SWEEPS), choices=list(SWEEPS), help="Sweeps to run")
+    parser.add_argument("--dc_points", type=int, default=10, help="Points of the DC sweep")
+    parser.add_argument("--bode_points", type=int, default=10, help="Points of the Bode sweeps")
+    parser.add_argument("--sweep_time", type=float, default=20, help="MFG sweep time of the hardware sweep")
+    parser.add_argument("--no_shadow", action="store_true", help="Send every write, even when it would not change a setting")
+    parser.add_argument("--trace", help="Save a Chrome trace of every sweep, named after this file and the sweep")
+    parser.add_argument("--latency", action="store_true", help="Print the latency of every command")
+    parser.add_argument("--output", default="benchmark.jsonl", help="Results are appended to this JSON lines file")
+    args = parser.parse_args()
+
+    for name in args.sweeps:
+        # A fresh session per sweep so the I/O wrappers do not stack
+        session = Session(args.slab_num, sim=args.sim, timeout=20000, shadow=not args.no_shadow)
+        tracer = Tracer()
+        result = benchmark(name, session, args, tracer)
+        session.close()
+        per_point = result["per_point"]
+        print(f"{name}: {result['points']} points in {result['wall']:.2f} s, "
+              f"{result['points_per_second']:.3f} points/s, {result['skipped_writes']} writes skipped, per point "
+              f"io {per_point['io']*1e3:.1f} ms, sleep {per_point['sleep']*1e3:.1f} ms, "
+              f"analysis {per_point['analysis']*1e3:.1f} ms")
+        if args.latency:
+            tracer.report()
+        if args.trace:
+            root, ext = os.path.splitext(args.trace)
+            tracer.save(f"{root}-{name}{ext or '.json'}")
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
@@ -0,0 +1,137 @@
+"""Full Bode plot from one MFG sweep captured as a single scope record.
+
+The MFG runs one log (or linear) sweep, the MDO records the whole sweep
+on the input and output channels, and the transfer function is rebuilt
+locally by a short-time lock-in against the known chirp.
+"""
+import time
+
+import numpy as np
+
+from scpi_batch import Batch
+from settling import wait_opc
+from waveform import read_channel, set_record_length
+
+ARM_TIME = 0.5  # Seconds for the MFG to arm the sweep before it is triggered
+MARGIN = 1.2  # Record span over the sweep time, leaving room before and after it
+
+
+def chirp_phase(tau, start, stop, sweep_time, spacing="LOG"):
+    """Phase and instantaneous frequency of the MFG sweep tau seconds after its start."""
+    if spacing == "LOG":
+        k = stop / start
+        frequency = start * k**(tau / sweep_time)
+        phase = 2 * np.pi * start * sweep_time / np.log(k) * (k**(tau / sweep_time) - 1)
+    else:
+        frequency = start + (stop - start) * tau / sweep_time
+        phase = 2 * np.pi * (start * tau + (stop - start) * tau**2 / (2 * sweep_time))
+    return phase, frequency
+
+
+def sweep_start(t, v_in, start, stop, sweep_time, spacing="LOG"):
+    """Estimate when the sweep started on the scope time axis.
+
+    The instantaneous frequency from the input's rising edges is mapped
+    back through the sweep law. The median, weighted by the time each
+    period covers, ignores the parts of the record before and after the
+    sweep.
+    """
+    v = v_in - np.mean(v_in)
+    # Rising edges with hysteresis of half the amplitude so noise does not add crossings
+    level = np.sqrt(2) * np.std(v) / 2
+    state = np.flatnonzero(np.abs(v) > level)
+    high = v[state] > 0
+    edges = state[1:][high[1:] & ~high[:-1]]
+    tc = t[edges]
+    period = np.diff(tc)
+    frequency = 1 / period
+    mid = (tc[:-1] + tc[1:]) / 2
+    inside = (frequency > start) & (frequency < stop)
+    if spacing == "LOG":
+        tau = sweep_time * np.log(frequency[inside] / start) / np.log(stop / start)
+    else:
+        tau = sweep_time * (frequency[inside] - start) / (stop - start)
+    estimates = mid[inside] - tau
+    order = np.argsort(estimates)
+    weight = np.cumsum(period[inside][order])
+    return estimates[order][np.searchsorted(weight, weight[-1] / 2)]
+
+
+def reconstruct(t, v_in, v_out, start, stop, sweep_time, spacing="LOG", points=100, cycles=10):
+    """Short-time lock-in of both channels against the chirp.
+
+    Returns frequencies, gain in dB and phase in degrees at points
+    frequencies spread over the sweep. Each window spans cycles periods;
+    all windows are evaluated at once from cumulative sums.
+    """
+    rate = (t.size - 1) / (t[-1] - t[0])
+    if rate < 2 * stop:
+        raise ValueError(f"Sample rate {rate:.3g} Sa/s is below twice the stop frequency {stop:.3g} Hz")
+    t0 = sweep_start(t, v_in, start, stop, sweep_time, spacing)
+    phase, _ = chirp_phase(t - t0, start, stop, sweep_time, spacing)
+    reference = np.exp(-1j * phase)
+    c_in = np.concatenate([[0], np.cumsum((v_in - v_in.mean()) * reference)])
+    c_out = np.concatenate([[0], np.cumsum((v_out - v_out.mean()) * reference)])
+
+    if spacing == "LOG":
+        frequencies = np.logspace(np.log10(start), np.log10(stop), points + 2)[1:-1]
+        tau = sweep_time * np.log(frequencies / start) / np.log(stop / start)
+    else:
+        frequencies = np.linspace(start, stop, points + 2)[1:-1]
+        tau = sweep_time * (frequencies - start) / (stop - start)
+    half = cycles / frequencies / 2
+    a = np.searchsorted(t, t0 + tau - half)
+    b = np.searchsorted(t, t0 + tau + half)
+    # Windows must lie within the sweep, outside it the reference is not the chirp
+    valid = (tau - half >= 0) & (tau + half <= sweep_time)
+    # and within the record
+    valid &= (a > 0) & (b < t.size) & (b - a > 4)
+    a, b = a[valid], b[valid]
+    h = (c_out[b] - c_out[a]) / (c_in[b] - c_in[a])
+    return frequencies[valid], 20 * np.log10(np.abs(h)), np.degrees(np.angle(h))
+
+
+def chirp_sweep(mfg, osc, args, points=100, record_length=1000000):
+    """Trigger one MFG sweep, capture it on both channels and rebuild the Bode plot."""
+    port = args.mfg_output_port
+    rate = record_length / (args.sweep_time * MARGIN)
+    if rate < 2 * args.stop_frequency:
+        raise ValueError(f"{record_length} points over {args.sweep_time * MARGIN:g} s sample at {rate:.3g} Sa/s, "
+                         f"below twice the stop frequency {args.stop_frequency:g} Hz; "
+                         f"raise --record_length or shorten --sweep_time")
+    with Batch(mfg) as batch:
+        batch.write(f'OUTPUT{port}:LOAD INF')
+        batch.write(f'SOURCE{port}:APPL:SIN {args.start_frequency},{args.amplitude},{args.offset}')
+        batch.write(f'SOURCE{port}:FREQ:START {args.start_frequency}')
+        batch.write(f'SOURCE{port}:FREQ:STOP {args.stop_frequency}')
+        batch.write(f'SOURCE{port}:SWEEP:SPACING LOG')
+        batch.write(f'SOURCE{port}:SWEEP:TIME {args.sweep_time}')
+        batch.write(f'SOURCE{port}:SWEEP:SOURCE MANUAL')
+        batch.write(f'SOURCE{port}:SWEEP:STATE ON')
+        batch.write(f'OUTPUT{port} ON')
+    wait_opc(mfg)
+
+    # Ten divisions covering the sweep with some margin on both sides
+    with Batch(osc) as batch:
+        batch.write(f':CHANnel{args.mdo_input_port_in}:DISPlay ON')
+        batch.write(f':CHANnel{args.mdo_input_port_out}:DISPlay ON')
+        batch.write(':ACQuire:MODe SAMPle')
+        batch.write(f':TIMebase:SCALe {args.sweep_time * MARGIN / 10}')
+        batch.write(':RUN')
+    set_record_length(osc, record_length)
+    wait_opc(osc)
+
+    # The MFG takes a moment to arm the sweep after SWEEP:STATE ON and
+    # ignores a trigger that comes sooner
+    time.sleep(ARM_TIME)
+    mfg.write('*TRG')
+    time.sleep(args.sweep_time * 1.1)
+    osc.write(':STOP')
+    try:
+        wave_in = read_channel(osc, args.mdo_input_port_in)
+        wave_out = read_channel(osc, args.mdo_input_port_out)
+    finally:
+        osc.write(':RUN')
+        mfg.write(f'SOURCE{port}:SWEEP:STATE OFF')
+    return reconstruct(wave_in.time, wave_in.volts, wave_out.volts,
+                       args.start_frequency, args.stop_frequency, args.sweep_time, points=points)
@@ -0,0 +1,289 @@
+"""gm/Id lookup tables for transistor sizing.
+
+A table holds the drain current, gm, gds and Cgg per unit width of one
+device type on a grid of L, VGS and VDS. It is built once from a
+simulator export (CSV) or from DC sweep result files and saved as a single
+binary file that is memory-mapped when opened, so sizing loops read only
+the pages they touch instead of parsing CSVs for every query.
+
+Besides the VGS grid the file keeps the same data resampled on a gm/Id
+grid, which turns the usual sizing question, "what Id/W, fT and intrinsic
+gain does this L give at this gm/Id", into one trilinear interpolation:
+
+    table = Table.open("nmos.lut")
+    op = table.lookup(gm_id=np.linspace(5, 25, 10**6), l=0.36e-6, vds=0.6)
+    width = id_target / op.id_w
+
+Voltages and currents of PMOS devices are stored as magnitudes.
+
+    python gm_id.py build --csv nmos.csv --width 1e-6 --out nmos.lut
+    python gm_id.py build --sweep 0.18e-6 0.6 vgs_sweep.jsonl ... --r_sense 1000 --width 1e-6 --out nmos.lut
+    python gm_id.py query nmos.lut --l 0.18e-6 --vds 0.6 --gm_id 5 10 15 20
+"""
+import argparse
+import json
+from collections import namedtuple
+
+import numpy as np
+
+import results
+
+# Quantities on the VGS grid, per metre of width
+QUANTITIES = ("id_w", "gm_w", "gds_w", "cgg_w")
+# Quantities on the gm/Id grid
+DESIGN = ("vgs", "id_w", "ft", "gain")
+
+# Operating point of a device, per metre of width
+Operating = namedtuple("Operating", "vgs id_w gm_id ft gain")
+
+CHUNK = 1 << 18  # Points interpolated at once, bounds the temporary arrays
+ALIGN = 64  # Array data starts on a multiple of this many bytes
+
+
+def interpolate(grid, axes, points):
+    """Multilinear interpolation of grid[..., quantity] at points (N, len(axes)).
+
+    The axes are sorted but need not be uniform. Points outside them are
+    clamped to the edge, an axis with a single value is constant.
+    """
+    lower, weight = [], []
+    for axis, x in zip(axes, points.T):
+        if axis.size < 2:
+            lower.append(np.zeros(x.size, dtype=int))
+            weight.append(np.zeros(x.size))
+            continue
+        i = np.clip(np.searchsorted(axis, x) - 1, 0, axis.size - 2)
+        lower.append(i)
+        weight.append(np.clip((x - axis[i]) / (axis[i + 1] - axis[i]), 0, 1))
+    # Gather the corners by flat index, a single take per corner
+    shape = grid.shape[:-1]
+    flat = grid.reshape(-1, grid.shape[-1])
+    base = np.ravel_multi_index(lower, shape)
+    strides = np.cumprod((1,) + shape[:0:-1])[::-1] * (np.array(shape) > 1)
+    out = np.zeros((points.shape[0], grid.shape[-1]))
+    for corner in np.ndindex(*(2,) * len(axes)):
+        w = np.ones(points.shape[0])
+        for t, bit in zip(weight, corner):
+            w *= t if bit else 1 - t
+        out += w[:, None] * flat.take(base + np.dot(corner, strides), axis=0)
+    return out
+
+
+def _points(*values):
+    """Broadcast the query arguments into a flat (N, len(values)) array and their shape."""
+    values = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in values))
+    return np.stack([v.ravel() for v in values], axis=1), values[0].shape
+
+
+def _chunked(grid, axes, points):
+    return np.concatenate([interpolate(grid, axes, points[i:i + CHUNK])
+                           for i in range(0, max(len(points), 1), CHUNK)])
+
+
+def resample(gm_id, vgs_grid, vgs, ft, gain, id_w):
+    """The DESIGN quantities on the gm_id axis for every L and VDS.
+
+    gm/Id falls with VGS above the subthreshold plateau, only that part of
+    each curve is used. gm/Id values a curve does not reach are NaN.
+    """
+    n_l, _, n_vds = vgs_grid.shape
+    out = np.full((n_l, gm_id.size, n_vds, len(DESIGN)), np.nan)
+    for i in range(n_l):
+        for k in range(n_vds):
+            curve = vgs_grid[i, :, k]
+            valid = np.isfinite(curve)
+            if valid.sum() < 2:
+                continue
+            start = np.nanargmax(curve)
+            # Monotonic from the peak on, noise would make the inversion ambiguous
+            falling = np.minimum.accumulate(np.where(valid, curve, -np.inf)[start:])
+            keep = np.isfinite(falling)
+            xp = falling[keep][::-1]
+            for q, values in enumerate((vgs, id_w[i, :, k], ft[i, :, k], gain[i, :, k])):
+                fp = values[start:][keep][::-1]
+                out[i, :, k, q] = np.interp(gm_id, xp, fp, left=np.nan, right=np.nan)
+    return out
+
+
+class Table:
+    """gm/Id lookup table, in memory after build() or memory-mapped after open()."""
+
+    def __init__(self, l, vgs, vds, data, gm_id, design, info=None):
+        self.l = np.asarray(l, dtype=float)
+        self.vgs = np.asarray(vgs, dtype=float)
+        self.vds = np.asarray(vds, dtype=float)
+        self.gm_id = np.asarray(gm_id, dtype=float)
+        # data[L, VGS, VDS, QUANTITIES], design[L, gm/Id, VDS, DESIGN]
+        self.data = data
+        self.design = design
+        self.info = info or {}
+
+    @classmethod
+    def build(cls, l, vgs, vds, id, gm=None, gds=None, cgg=None, width=1.0, gm_id_points=128, info=None):
+        """Table from arrays shaped (L, VGS, VDS) for a device of the given width.
+
+        gm and gds default to the derivatives of id along VGS and VDS. Without
+        cgg the transit frequency is NaN.
+        """
+        l, vgs, vds = (np.asarray(axis, dtype=float) for axis in (l, vgs, vds))
+        id = np.abs(np.asarray(id, dtype=float))
+        if gm is None:
+            gm = np.gradient(id, vgs, axis=1)
+        if gds is None:
+            gds = np.gradient(id, vds, axis=2) if vds.size > 1 else np.full(id.shape, np.nan)
+        if cgg is None:
+            cgg = np.full(id.shape, np.nan)
+        data = np.stack([id, np.abs(gm), np.abs(gds), np.abs(np.asarray(cgg, dtype=float))], axis=-1) / width
+        id_w, gm_w, gds_w, cgg_w = np.moveaxis(data, -1, 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            gm_id_grid = gm_w / id_w
+            ft = gm_w / (2 * np.pi * cgg_w)
+            gain = gm_w / gds_w
+        gm_id_grid[~np.isfinite(gm_id_grid)] = np.nan
+        gm_id = np.linspace(np.nanmin(gm_id_grid), np.nanmax(gm_id_grid), gm_id_points)
+        design = resample(gm_id, gm_id_grid, vgs, ft, gain, id_w)
+        return cls(l, vgs, vds, data.astype(np.float32), gm_id, design.astype(np.float32), info)
+
+    def save(self, path):
+        """One file: a line of JSON describing the arrays, then the arrays as float32."""
+        arrays = {"data": self.data, "design": self.design}
+        header = {
+            "l": self.l.tolist(), "vgs": self.vgs.tolist(), "vds": self.vds.tolist(), "gm_id": self.gm_id.tolist(),
+            "quantities": list(QUANTITIES), "design_quantities": list(DESIGN), "info": self.info, "arrays": {},
+        }
+        # The offsets depend on the header length, grow it until they fit
+        size = ALIGN
+        while True:
+            offset = size
+            for name, array in arrays.items():
+                header["arrays"][name] = {"offset": offset, "shape": list(array.shape)}
+                offset += array.size * 4
+            text = json.dumps(header).encode()
+            if len(text) < size:
+                break
+            size = (len(text) // ALIGN + 1) * ALIGN
+        with open(path, "wb") as f:
+            f.write(text.ljust(size - 1) + b"\n")
+            for array in arrays.values():
+                f.write(np.ascontiguousarray(array, dtype="<f4").tobytes())
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+        arrays = {name: np.memmap(path, dtype="<f4", mode="r", offset=spec["offset"], shape=tuple(spec["shape"]))
+                  for name, spec in header["arrays"].items()}
+        return cls(header["l"], header["vgs"], header["vds"], arrays["data"], header["gm_id"], arrays["design"],
+                   header["info"])
+
+    def at(self, l, vgs, vds):
+        """Operating point at a bias, every argument broadcast against the others."""
+        points, shape = _points(l, vgs, vds)
+        id_w, gm_w, gds_w, cgg_w = _chunked(self.data, (self.l, self.vgs, self.vds), points).T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = (points[:, 1], id_w, gm_w / id_w, gm_w / (2 * np.pi * cgg_w), gm_w / gds_w)
+        return Operating(*(v.reshape(shape) for v in values))
+
+    def lookup(self, gm_id, l, vds):
+        """Operating point at a gm/Id, every argument broadcast against the others.
+
+        NaN where the device does not reach the gm/Id at that L and VDS.
+        """
+        points, shape = _points(l, gm_id, vds)
+        vgs, id_w, ft, gain = _chunked(self.design, (self.l, self.gm_id, self.vds), points).T
+        return Operating(vgs.reshape(shape), id_w.reshape(shape), points[:, 1].reshape(shape),
+                         ft.reshape(shape), gain.reshape(shape))
+
+
+def _grid(l, vgs, vds, columns):
+    """Place scattered (l, vgs, vds) rows on their full grid."""
+    axes = [np.unique(values) for values in (l, vgs, vds)]
+    index = tuple(np.searchsorted(axis, values) for axis, values in zip(axes, (l, vgs, vds)))
+    shape = tuple(axis.size for axis in axes)
+    if len(l) != np.prod(shape):
+        raise ValueError(f"{len(l)} rows do not fill a {' x '.join(map(str, shape))} L x VGS x VDS grid")
+    grids = {}
+    for name, values in columns.items():
+        grids[name] = np.full(shape, np.nan)
+        grids[name][index] = values
+    return axes, grids
+
+
+def from_csv(path, width=1.0, gm_id_points=128):
+    """Table from a simulator export with a header row and the columns L, VGS,
+    VDS, ID and optionally GM, GDS and CGG, in any case and order."""
+    rows = np.genfromtxt(path, delimiter=",", names=True)
+    names = {name.lower(): name for name in rows.dtype.names}
+    missing = {"l", "vgs", "vds", "id"} - set(names)
+    if missing:
+        raise ValueError(f"{path} has no column {', '.join(sorted(missing))}")
+    columns = {q: np.abs(rows[names[q]]) for q in ("id", "gm", "gds", "cgg") if q in names}
+    (l, vgs, vds), grids = _grid(np.abs(rows[names["l"]]), np.abs(rows[names["vgs"]]), np.abs(rows[names["vds"]]), columns)
+    return Table.build(l, vgs, vds, width=width, gm_id_points=gm_id_points,
+                       info={"source": path, "width": width}, **grids)
+
+
+def from_sweeps(sweeps, r_sense, width=1.0, gm_id_points=128):
+    """Table from voltage_sweep_DC.py result files, one VGS sweep per L and VDS.
+
+    sweeps is a list of (l, vds, path). The supply sets VGS and the GDM
+    reads the drop over a sense resistor of r_sense ohms in the drain, so
+    Id = V / r_sense. Sweeps with other setpoints are interpolated onto the
+    setpoints of the first.
+    """
+    sweeps = sorted(sweeps, key=lambda sweep: (sweep[0], sweep[1]))
+    vgs = None
+    rows = {"l": [], "vgs": [], "vds": [], "id": []}
+    for l, vds, path in sweeps:
+        _, columns = results.load(path)
+        measured = columns["measured"] if "measured" in columns else columns["mean"]
+        if vgs is None:
+            vgs = columns["set"]
+        rows["l"].append(np.full(vgs.size, l))
+        rows["vds"].append(np.full(vgs.size, vds))
+        rows["vgs"].append(vgs)
+        rows["id"].append(np.interp(vgs, columns["set"], np.abs(measured) / r_sense))
+    rows = {name: np.concatenate(values) for name, values in rows.items()}
+    (l, vgs, vds), grids = _grid(rows["l"], rows["vgs"], rows["vds"], {"id": rows["id"]})
+    return Table.build(l, vgs, vds, width=width, gm_id_points=gm_id_points,
+                       info={"source": [path for _, _, path in sweeps], "r_sense": r_sense, "width": width}, **grids)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Build and query gm/Id lookup tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build a table from a simulator export or DC sweeps")
+    source = build.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="Simulator export with the columns L, VGS, VDS, ID and optionally GM, GDS, CGG")
+    source.add_argument("--sweep", nargs=3, action="append", metavar=("L", "VDS", "FILE"),
+                        help="voltage_sweep_DC.py result file of a VGS sweep at this L and VDS, repeat for every sweep")
+    build.add_argument("--r_sense", type=float, help="Drain sense resistor in ohms for --sweep")
+    build.add_argument("--width", type=float, default=1.0, help="Width of the characterised device in metres")
+    build.add_argument("--gm_id_points", type=int, default=128, help="Points of the gm/Id grid")
+    build.add_argument("--out", required=True, help="Table file to write")
+    query = commands.add_parser("query", help="Operating points at given gm/Id values")
+    query.add_argument("table", help="Table file")
+    query.add_argument("--l", type=float, required=True, help="Channel length in metres")
+    query.add_argument("--vds", type=float, required=True, help="Drain-source voltage")
+    query.add_argument("--gm_id", type=float, nargs="+", required=True, help="gm/Id values in 1/V")
+    return parser
+
+
+if (__name__ == "__main__"):
+    args = build_parser().parse_args()
+    if args.command == "build":
+        if args.csv:
+            table = from_csv(args.csv, args.width, args.gm_id_points)
+        else:
+            if args.r_sense is None:
+                raise SystemExit("--sweep needs --r_sense")
+            table = from_sweeps([(float(l), float(vds), path) for l, vds, path in args.sweep], args.r_sense,
+                                args.width, args.gm_id_points)
+        table.save(args.out)
+        print(f"{args.out}: {table.l.size} L x {table.vgs.size} VGS x {table.vds.size} VDS, "
+              f"gm/Id {table.gm_id[0]:.1f} to {table.gm_id[-1]:.1f} 1/V")
+    else:
+        op = Table.open(args.table).lookup(args.gm_id, args.l, args.vds)
+        print(f"{'gm/Id':>8} {'VGS':>8} {'Id/W A/m':>10} {'fT Hz':>10} {'gm/gds':>8}")
+        for values in zip(op.gm_id, op.vgs, op.id_w, op.ft, op.gain):
+            print("{:8.2f} {:8.3f} {:10.3e} {:10.3e} {:8.1f}".format(*values))
@@ -0,0 +1,406 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# numpy and pyvisa are imported where they are needed so that quick commands
+# do not wait for them to load
+
+# Socket port of each tool on the nano-slab benches
+PORTS = {
+    "mdo": 3000, #oscilloscope
+    "gdm": 3001, #multi meter
+    "mfg": 1026, #function generator
+    "gpp": 1026, #power supply
+}
+
+LABS = range(1, 7)
+
+# Readings per second of the GDM at each detector rate
+GDM_RATES = {"S": 5, "M": 20, "F": 40}
+
+INVENTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "inventory.json")
+# Seconds an inventory entry is trusted for, tools get swapped between lab sessions
+INVENTORY_MAX_AGE = 3600
+
+# Commands after which the settings of a tool are no longer known, in short form
+RESETS = {"*RST", "*RCL", "*TRG", "SYST:PRES", "AUT", "AUTOS"}
+
+_rm = None
+_TOKEN = re.compile(r"^(\D*?)(\d*)$")
+_VSET = re.compile(r"^VSET(\d)\s*:\s*(\S+)$", re.I)
+
+
+def resource_manager(sim=None):
+    """The shared VISA resource manager, or a simulated bench if sim is set.
+
+    sim is "default" or the path of a JSON file overriding sim.DEFAULTS.
+    """
+    global _rm
+    if sim:
+        import sim as simulator
+        return simulator.SimResourceManager(simulator.load_config(sim))
+    if _rm is None:
+        import pyvisa
+        _rm = pyvisa.ResourceManager()
+    return _rm
+
+
+def resource_name(lab_num, tool):
+    return f"TCPIP::nano-slab-{lab_num}-{tool}.uio.no::{PORTS[tool]}::SOCKET"
+
+
+def short_form(keyword):
+    # SCPI short form: the upper case letters of the long form as the manuals
+    # write it, RECOrdlength -> RECO. A keyword in a single case has nothing
+    # to go by, so it gets the usual four characters, three if the fourth is a vowel.
+    if not keyword.isupper() and not keyword.islower():
+        return ''.join(c for c in keyword if c.isupper())
+    keyword = keyword.upper()
+    if len(keyword) > 3 and keyword[3] in "AEIOU":
+        return keyword[:3]
+    return keyword[:4]
+
+
+def short_header(header, suffix=""):
+    """':CHANnel1:DISPlay' -> 'CHAN1:DISP', so long and short forms compare equal.
+
+    suffix stands in for a missing numeric suffix, with '1' SOURce and
+    SOURce1 give the same key as they are the same on the tool.
+    """
+    if header.startswith('*'):
+        return header.upper()
+    keys = []
+    for token in header.lstrip(':').split(':'):
+        name, index = _TOKEN.match(token).groups()
+        keys.append(short_form(name) + (index or suffix))
+    return ':'.join(keys)
+
+
+def _value(text):
+    text = text.strip().upper()
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def setting(command):
+    """(key, value) of a command that sets something, None for queries and actions."""
+    command = command.strip()
+    vset = _VSET.match(command)
+    if vset:
+        return f"VSET{vset[1]}", _value(vset[2])
+    header, _, value = command.partition(' ')
+    if header.startswith('*') or header.endswith('?') or not value.strip():
+        return None
+    return short_header(header, "1"), _value(value)
+
+
+def open_tool(rm, lab_num, tool, timeout=None, open_timeout=None):
+    kwargs = {}
+    if open_timeout is not None:
+        kwargs["open_timeout"] = open_timeout
+    resource = rm.open_resource(resource_name(lab_num, tool), **kwargs)
+    resource.read_termination = '\n'
+    # The GPP does not accept a write termination
+    if tool != "gpp":
+        resource.write_termination = '\n'
+    if timeout is not None:
+        resource.timeout = timeout
+    return resource
+
+
+class Tool:
+    name = None
+
+    def __init__(self, resource, lab_num, shadow=True):
+        self.resource = resource
+        self.lab_num = lab_num
+        self.idn = None
+        # Last value written to each setting, None turns the shadow off
+        self.shadow = {} if shadow else None
+        self.skipped = 0
+
+    def write(self, command):
+        command = self._changes(command)
+        if not command:
+            return None
+        return self.resource.write(command)
+
+    def query(self, command):
+        return self.resource.query(self._changes(command))
+
+    def invalidate(self, prefix=""):
+        """Forget the shadowed settings starting with prefix (short form), all by default.
+
+        Needed after anything that changes settings behind the shadow's back,
+        like the front panel.
+        """
+        if self.shadow is not None:
+            for key in [key for key in self.shadow if key.startswith(prefix)]:
+                del self.shadow[key]
+
+    def _changes(self, message):
+        # Drop the settings the tool already has from a ';' joined message
+        if self.shadow is None:
+            return message
+        parts = message.split(';')
+        if any(not part.strip().startswith((':', '*')) for part in parts[1:]):
+            # Relative headers depend on the commands before them
+            self.invalidate()
+            return message
+        return ';'.join(part for part in parts if self._needed(part))
+
+    def _needed(self, command):
+        key_value = setting(command)
+        if key_value is None:
+            if short_header(command.strip().partition(' ')[0].rstrip('?')) in RESETS:
+                self.invalidate()
+            return True
+        key, value = key_value
+        if ':APPL' in key:
+            # APPLy sets the function, frequency, amplitude and offset at once
+            self.invalidate(key.split(':')[0] + ':')
+            return True
+        if self.shadow.get(key) == value:
+            self.skipped += 1
+            return False
+        self.shadow[key] = value
+        return True
+
+    def identify(self):
+        self.idn = self.query('*IDN?')
+        return self.idn
+
+    def close(self):
+        self.resource.close()
+
+    def __repr__(self):
+        return f"<{type(self).__name__} slab {self.lab_num}: {self.idn}>"
+
+
+class MFG(Tool):
+    name = "mfg"
+
+    def load_inf(self, port):
+        self.write(f'OUTPUT{port}:LOAD INF')
+
+    def apply_sin(self, port, frequency, amplitude, offset):
+        self.write(f'SOURCE{port}:APPL:SIN {frequency},{amplitude},{offset}')
+
+    def apply_square(self, port, frequency, amplitude, offset):
+        self.write(f'SOURCE{port}:APPL:SQU {frequency},{amplitude},{offset}')
+
+    def set_frequency(self, port, frequency):
+        self.write(f'SOURCE{port}:FREQUENCY {frequency}')
+
+    def output(self, port, on=True):
+        self.write(f'OUTPUT{port} {"ON" if on else "OFF"}')
+
+
+class MDO(Tool):
+    name = "mdo"
+
+    def display(self, channel, on=True):
+        self.write(f':CHANnel{channel}:DISPlay {"ON" if on else "OFF"}')
+
+    def trigger_edge(self, channel, level, slope="RISe"):
+        self.write(f':TRIGger:SOURce CH{channel};:TRIGger:EDGe:SLOPe {slope};:TRIGger:LEVel {level}')
+
+    def measure(self, quantity, channel):
+        self.write(f':MEASure:SOURce1 CH{channel}')
+        return self.query(f':MEASure:{quantity}?')
+
+
+class GDM(Tool):
+    name = "gdm"
+
+    def measure_dc(self):
+        value = float(self.query('measure:voltage:DC?'))
+        # MEASure reconfigures the meter
+        self.invalidate()
+        return value
+
+    def configure_dc(self, samples, voltage_range="DEF", rate="M"):
+        """Set up DC voltage readings in blocks of samples, read with acquire().
+
+        measure_dc() reconfigures the meter, so do not mix the two.
+        """
+        self.samples = samples
+        self.rate = rate
+        self.write(f':CONFigure:VOLTage:DC {voltage_range};:DETector:RATE {rate};'
+                   f':SAMPle:COUNt {samples};:TRIGger:SOURce IMMediate')
+
+    def readings(self):
+        """One block of readings as an array."""
+        import numpy as np
+        old_timeout = self.resource.timeout
+        # Allow for the time the block takes on top of the usual timeout
+        self.resource.timeout = (old_timeout or 2000) + 1000 * self.samples / GDM_RATES[self.rate]
+        try:
+            return np.array(self.query(':INITiate;:FETCh?').split(','), dtype=float)
+        finally:
+            self.resource.timeout = old_timeout
+
+    def acquire(self):
+        """Mean, standard deviation and count of one block of readings."""
+        readings = self.readings()
+        std = readings.std(ddof=1) if readings.size > 1 else 0.0
+        return readings.mean(), std, readings.size
+
+
+class GPP(Tool):
+    name = "gpp"
+
+    def set_voltage(self, port, voltage):
+        self.write(f'VSET{port}:{voltage}')
+
+    def output(self, port, on=True):
+        self.write(f':output{port}:state {"on" if on else "off"}')
+
+    def error(self):
+        """Code of the oldest entry in the error queue, 0 when it is empty."""
+        return int(self.query(':SYSTem:ERRor?').split(',')[0])
+
+    def upload_list(self, port, voltages, dwell):
+        """Load setpoints the supply steps through by itself, dwell seconds each.
+
+        Started by start_list(). Returns False if the supply does not take a
+        list, in which case the caller has to step the output itself.
+        """
+        self.write(f':LIST{port}:VOLTage {",".join(f"{v:g}" for v in voltages)}')
+        self.write(f':LIST{port}:DWELl {dwell}')
+        self.write(f':LIST{port}:STATe ON')
+        from pyvisa.errors import VisaIOError
+        try:
+            return self.error() == 0
+        except (VisaIOError, ValueError):
+            return False
+
+    def start_list(self):
+        self.write('*TRG')
+
+    def stop_list(self, port):
+        self.write(f':LIST{port}:STATe OFF')
+
+
+TOOLS = {cls.name: cls for cls in (MFG, MDO, GDM, GPP)}
+
+
+class Session:
+    """Keeps the instruments of one slab open and identified.
+
+    Tools are opened on first use and reused afterwards, so back to back
+    sweeps in the same process do not reconnect or resend *IDN?.
+    """
+
+    def __init__(self, lab_num, rm=None, timeout=None, verbose=True, inventory=None, sim=None, shadow=True,
+                 tracer=None):
+        self.lab_num = lab_num
+        self.shadow = shadow
+        # tracing.Tracer recording the I/O of every tool opened, if any
+        self.tracer = tracer
+        self.rm = rm if rm is not None else resource_manager(sim)
+        self.timeout = timeout
+        self.verbose = verbose
+        if inventory is None:
+            # The inventory describes the real benches only
+            inventory = {} if sim else load_inventory()
+        self.inventory = inventory
+        self.tools = {}
+
+    def get(self, tool):
+        if tool not in self.tools:
+            resource = open_tool(self.rm, self.lab_num, tool, self.timeout)
+            handle = TOOLS[tool](resource, self.lab_num, shadow=self.shadow)
+            if self.tracer is not None:
+                self.tracer.attach(handle)
+            # Trust a recent discovery instead of sending *IDN? again
+            entry = self.inventory.get(inventory_key(self.lab_num, tool))
+            if entry and entry["reachable"] and time.time() - entry.get("time", 0) < INVENTORY_MAX_AGE:
+                handle.idn = entry["idn"]
+            else:
+                handle.identify()
+            if self.verbose:
+                print(handle.idn)
+            self.tools[tool] = handle
+        return self.tools[tool]
+
+    @property
+    def mfg(self):
+        return self.get("mfg")
+
+    @property
+    def mdo(self):
+        return self.get("mdo")
+
+    @property
+    def gdm(self):
+        return self.get("gdm")
+
+    @property
+    def gpp(self):
+        return self.get("gpp")
+
+    def close(self):
+        for handle in self.tools.values():
+            handle.close()
+        self.tools.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def inventory_key(lab_num, tool):
+    return f"{lab_num}-{tool}"
+
+
+def probe(rm, lab_num, tool, timeout=1000):
+    """Open and identify one tool within timeout milliseconds."""
+    start = time.perf_counter()
+    entry = {"lab_num": lab_num, "tool": tool, "idn": None, "reachable": False, "time": time.time()}
+    try:
+        resource = open_tool(rm, lab_num, tool, timeout=timeout, open_timeout=timeout)
+        try:
+            entry["idn"] = resource.query('*IDN?').strip()
+            entry["reachable"] = True
+        finally:
+            resource.close()
+    except Exception as err:
+        entry["error"] = str(err)
+    entry["latency"] = time.perf_counter() - start
+    return entry
+
+
+def discover(labs=LABS, tools=tuple(PORTS), timeout=1000, rm=None):
+    """Probe every slab/tool pair concurrently.
+
+    The whole scan takes about as long as the slowest probe, which is
+    bounded by timeout, instead of the sum of all of them.
+    """
+    rm = rm if rm is not None else resource_manager()
+    pairs = [(lab_num, tool) for lab_num in labs for tool in tools]
+    with ThreadPoolExecutor(max_workers=len(pairs)) as pool:
+        entries = pool.map(lambda pair: probe(rm, *pair, timeout=timeout), pairs)
+        return {inventory_key(e["lab_num"], e["tool"]): e for e in entries}
+
+
+def save_inventory(inventory, path=INVENTORY):
+    with open(path, "w") as f:
+        json.dump({"time": time.time(), "tools": inventory}, f, indent=2)
+
+
+def load_inventory(path=INVENTORY):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        inventory = json.load(f)
+    # Entries saved before they had their own time date from the scan
+    for entry in inventory["tools"].values():
+        entry.setdefault("time", inventory["time"])
+    return inventory["tools"]
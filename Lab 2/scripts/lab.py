@@ -0,0 +1,48 @@
+"""One entry point for the bench scripts.
+
+    python lab.py tool-check --slab_num 1 --tool gpp
+    python lab.py dc-sweep --slab_num 1 --output_port 1 --voltage_min 0 --voltage_max 5 --voltage_step 0.1
+
+Every command takes the arguments of the script it runs, see
+python lab.py <command> --help. Only that script is imported, so quick
+commands start without loading numpy, matplotlib or the sweep code, and
+the tools are opened by address without scanning the VISA bus.
+"""
+import argparse
+import importlib
+
+# Command: (script, help)
+COMMANDS = {
+    "tool-check": ("tool_check", "Open one tool and print its identity"),
+    "set-dc": ("set_voltage_DC", "Set both GPP outputs and read the voltage with the GDM"),
+    "set-ac": ("set_voltage_AC", "Apply a sine on the MFG and measure it with the MDO"),
+    "dc-sweep": ("voltage_sweep_DC", "Sweep a GPP output and read it with the GDM"),
+    "bode": ("read_waveform_mdo", "Measure and plot the frequency response"),
+    "phase": ("read_phase_AC", "Apply a sine and read the output channel of the MDO"),
+    "step": ("step_response", "Estimate the phase margin from one edge of a square wave"),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run one of the bench scripts")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (script, summary) in COMMANDS.items():
+        # The script parses its own arguments, --help included
+        commands.add_parser(name, help=summary, add_help=False)
+    return parser
+
+
+def main(argv=None):
+    args, script_argv = build_parser().parse_known_args(argv)
+    script = importlib.import_module(COMMANDS[args.command][0])
+    parser = script.build_parser()
+    parser.prog = f"lab.py {args.command}"
+    script_args = parser.parse_args(script_argv)
+    # Option combinations the script refuses, if it has any
+    if hasattr(script, "check_args"):
+        script.check_args(parser, script_args)
+    script.main(script_args)
+
+
+if (__name__ == "__main__"):
+    main()
@@ -0,0 +1,156 @@
+"""Live view of a sweep while it runs.
+
+The measurement loop hands every point to LivePlot.add(), which puts it on
+a queue and returns at once. A separate process drains the queue, moves
+the new points into the existing lines instead of replotting, and shows
+them in a window and/or rewrites PNG or SVG snapshots every few seconds,
+so a bad setup shows up minutes into a long sweep and not at its end.
+Rendering never runs in the process that talks to the instruments: when
+the plot falls behind, points are dropped from the view, not the sweep.
+"""
+import multiprocessing
+import os
+import queue
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# One axis per ylabel, sharing the x axis
+Layout = namedtuple("Layout", "title xlabel ylabels xscale")
+
+LAYOUTS = {
+    "bode": Layout("Bode Plot", "Frequency [Hz]", ("Gain [dB]", "Phase Shift [Degrees]"), "log"),
+    "dc": Layout("DC sweep", "Set voltage [V]", ("Measured voltage [V]",), "linear"),
+}
+
+INTERVAL = 2.0  # Seconds between snapshots
+QUEUED = 10000  # Points the queue holds before add() drops them
+
+
+def _snapshot(fig, path):
+    # Write next to the file and rename, so a viewer never sees half a file
+    root, ext = os.path.splitext(path)
+    part = f"{root}.part{ext}"
+    fig.savefig(part)
+    os.replace(part, path)
+
+
+def _render(points, layout, show, snapshots, interval):
+    """Body of the plotting process, runs until add() sends None."""
+    import matplotlib
+    if not show:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(len(layout.ylabels), 1, figsize=(10, 8), sharex=True, squeeze=False)
+    axes = axes[:, 0]
+    axes[0].set_title(layout.title)
+    for ax, ylabel in zip(axes, layout.ylabels):
+        ax.set_xscale(layout.xscale)
+        ax.set_ylabel(ylabel)
+        ax.grid(True)
+    axes[-1].set_xlabel(layout.xlabel)
+    fig.tight_layout()
+    if show:
+        plt.show(block=False)
+
+    rows = {}  # Points of every series
+    lines = {}  # Line per axis of every series
+    saved = time.monotonic()
+    unsaved = False
+    done = False
+    while not done:
+        changed = set()
+        try:
+            point = points.get(timeout=0.05)
+            while True:
+                if point is None:
+                    done = True
+                    break
+                series, x, ys = point
+                rows.setdefault(series, []).append((x, *ys))
+                changed.add(series)
+                point = points.get_nowait()
+        except queue.Empty:
+            pass
+
+        for series in changed:
+            # Adaptive sweeps do not arrive in order of x
+            data = np.array(sorted(rows[series]))
+            if series not in lines:
+                lines[series] = [ax.plot([], [], '.-', label=series or None)[0] for ax in axes]
+                if series:
+                    axes[0].legend()
+            for i, line in enumerate(lines[series]):
+                line.set_data(data[:, 0], data[:, i + 1])
+        if changed:
+            for ax in axes:
+                ax.relim()
+                ax.autoscale_view()
+            unsaved = True
+            if show:
+                fig.canvas.draw_idle()
+        if show:
+            fig.canvas.flush_events()
+
+        if snapshots and unsaved and (done or time.monotonic() - saved >= interval):
+            for path in snapshots:
+                _snapshot(fig, path)
+            saved = time.monotonic()
+            unsaved = False
+
+
+class LivePlot:
+    """Plots sweep points as they come in, see the module docstring.
+
+    layout is a key of LAYOUTS. show opens a window, snapshots lists the
+    PNG or SVG files to keep up to date, which works without a display.
+    """
+
+    def __init__(self, layout, show=True, snapshots=(), interval=INTERVAL):
+        # A spawned process starts clean of the sockets and threads of this one
+        context = multiprocessing.get_context("spawn")
+        self.points = context.Queue(QUEUED)
+        self.dropped = 0
+        self.process = context.Process(target=_render, daemon=True,
+                                       args=(self.points, LAYOUTS[layout], show, list(snapshots), interval))
+        self.process.start()
+
+    def add(self, x, *ys, series=""):
+        """Queue a point with one y per axis of the layout. Never waits or
+        raises, a point that is not numbers or does not fit is dropped."""
+        try:
+            self.points.put_nowait((series, float(x), tuple(float(y) for y in ys)))
+        except (queue.Full, TypeError, ValueError):
+            self.dropped += 1
+
+    def close(self, timeout=30):
+        """Wait for the last points and snapshot, then end the process."""
+        try:
+            self.points.put(None, timeout=1)
+        except queue.Full:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.dropped:
+            print(f"Live plot dropped {self.dropped} points")
+
+
+class Series:
+    """Adds to a LivePlot under a name of its own, like one slab of several."""
+
+    def __init__(self, live, name):
+        self.live = live
+        self.name = name
+
+    def add(self, x, *ys, series=""):
+        self.live.add(x, *ys, series=f"{self.name} {series}".strip())
+
+
+def open_live(args, layout):
+    """The LivePlot for --live and --snapshot, or None when neither is given."""
+    if not args.live and not args.snapshot:
+        return None
+    return LivePlot(layout, show=args.live, snapshots=args.snapshot or ())
@@ -0,0 +1,155 @@
+"""Run the same sweep on several slabs at once.
+
+Every slab gets its own session and worker thread. The sweeps spend
+nearly all their time waiting on instrument I/O, so the slabs run side by
+side and the whole run takes about as long as the slowest board instead
+of the sum of all of them. The results are merged into one dataset with
+a slab column. --trace and --live/--snapshot of the sweep script cover
+all slabs: one trace with a row group per slab, one plot with a line per
+slab.
+
+Arguments after the orchestrator's own are passed on to the sweep script,
+without --slab_num, e.g.
+
+    python multi_slab.py --slabs 1 2 3 --sweep dc --save dc.npz -- \\
+        --output_port 1 --voltage_min 0 --voltage_max 5 --voltage_step 0.1
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+
+from instruments import LABS, Session
+from results import open_results
+from live_plot import Series, open_live
+from tracing import Tracer
+import read_waveform_mdo
+import voltage_sweep_DC
+
+
+def run_dc(session, args, store, live=None):
+    if args.voltage_ci is not None:
+        set_values, mean, std, count, ci = voltage_sweep_DC.confident_dc_sweep(session.gpp, session.gdm, args, store, live)
+        return {"set": set_values, "mean": mean, "std": std, "count": count, "ci": ci}
+    if args.samples > 1:
+        set_values, mean, std, count = voltage_sweep_DC.buffered_dc_sweep(session.gpp, session.gdm, args, store, live)
+        return {"set": set_values, "mean": mean, "std": std, "count": count}
+    sweep = voltage_sweep_DC.sequenced_dc_sweep if args.sequence else voltage_sweep_DC.dc_sweep
+    set_values, meas_values = sweep(session.gpp, session.gdm, args, store, live)
+    return {"set": set_values, "measured": meas_values}
+
+
+def run_bode(session, args, store, live=None):
+    read_waveform_mdo.configure(session.mfg, session.mdo, args)
+    frequencies, duts = read_waveform_mdo.dut_responses(session.mfg, session.mdo, args, store, live)
+    result = {"frequency": frequencies}
+    for i, (vpp_in, vpp_out, phase_shift) in enumerate(duts):
+        # Numbered per DUT with --dual, like the result file columns
+        dut = str(i + 1) if args.dual else ""
+        result["vpp_in" + dut] = vpp_in
+        result["vpp_out" + dut] = vpp_out
+        result["phase" + dut] = phase_shift
+        result["gain" + dut] = read_waveform_mdo.calculate_gain(vpp_in, vpp_out)
+    return result
+
+
+def dc_columns(args):
+    if args.voltage_ci is not None:
+        return ("set", "mean", "std", "count", "ci")
+    return ("set", "mean", "std", "count") if args.samples > 1 else ("set", "measured")
+
+
+# Sweep name: (script, function running it on one session, result file columns from the arguments,
+# live_plot layout)
+SWEEPS = {
+    "dc": (voltage_sweep_DC, run_dc, dc_columns, "dc"),
+    "bode": (read_waveform_mdo, run_bode, read_waveform_mdo.result_columns, "bode"),
+}
+
+
+def slab_args(script, lab_num, sweep_argv, sim):
+    parser = script.build_parser()
+    args = parser.parse_args(["--slab_num", str(lab_num), *sweep_argv])
+    if hasattr(script, "check_args"):
+        script.check_args(parser, args)
+    args.sim = sim
+    if args.output:
+        # One result file per slab
+        root, ext = os.path.splitext(args.output)
+        args.output = f"{root}-slab{lab_num}{ext}"
+    return args
+
+
+def run_slab(name, lab_num, sweep_argv, sim=None, tracer=None, live=None):
+    script, run, columns, _ = SWEEPS[name]
+    args = slab_args(script, lab_num, sweep_argv, sim)
+    start = time.perf_counter()
+    with Session(lab_num, sim=sim, timeout=20000, verbose=False, tracer=tracer) as session:
+        store = open_results(args, columns(args), session)
+        try:
+            result = run(session, args, store, live and Series(live, f"slab {lab_num}"))
+        finally:
+            if store is not None:
+                store.close()
+    print(f"Slab {lab_num} done in {time.perf_counter() - start:.1f} s")
+    return {key: np.asarray(values, dtype=float) for key, values in result.items()}
+
+
+def run_slabs(name, labs, sweep_argv, sim=None):
+    """Sweep every slab concurrently.
+
+    Returns the results of the slabs that finished, by slab number. A slab
+    that fails is reported and left out without stopping the others.
+    """
+    script, _, _, layout = SWEEPS[name]
+    # The trace and the plot are shared by the slabs
+    shared = slab_args(script, labs[0], sweep_argv, sim)
+    tracer = Tracer() if shared.trace else None
+    live = open_live(shared, layout)
+    results = {}
+    with tracer.sleeps() if tracer else nullcontext():
+        with ThreadPoolExecutor(max_workers=len(labs)) as pool:
+            futures = {lab_num: pool.submit(run_slab, name, lab_num, sweep_argv, sim, tracer, live) for lab_num in labs}
+            for lab_num, future in futures.items():
+                try:
+                    results[lab_num] = future.result()
+                except Exception as err:
+                    print(f"Slab {lab_num} failed: {err!r}")
+    if live is not None:
+        live.close()
+    if tracer:
+        tracer.report()
+        tracer.save(shared.trace)
+    return results
+
+
+def merge(results):
+    """One set of columns over all slabs, tagged by a slab column."""
+    merged = {"slab": np.concatenate([np.full(len(next(iter(r.values()))), lab_num) for lab_num, r in results.items()])}
+    for key in next(iter(results.values())):
+        merged[key] = np.concatenate([r[key] for r in results.values()])
+    return merged
+
+
+if (__name__ == "__main__"):
+    parser = argparse.ArgumentParser(description="Run one sweep on several slabs in parallel")
+    parser.add_argument("--slabs", nargs="+", type=int, default=list(LABS), help="Lab space numbers to sweep")
+    parser.add_argument("--sweep", required=True, choices=list(SWEEPS), help="Sweep to run on every slab")
+    parser.add_argument("--save", help="Save the merged dataset to this .npz file")
+    parser.add_argument("--sim", nargs="?", const="default", help="Use the simulated bench, optionally configured by a JSON file")
+    args, sweep_argv = parser.parse_known_args()
+    if sweep_argv and sweep_argv[0] == "--":
+        sweep_argv = sweep_argv[1:]
+
+    start = time.perf_counter()
+    results = run_slabs(args.sweep, args.slabs, sweep_argv, args.sim)
+    print(f"{len(results)} of {len(args.slabs)} slabs in {time.perf_counter() - start:.1f} s")
+    if results:
+        merged = merge(results)
+        if args.save:
+            np.savez(args.save, **merged)
+        else:
+            print(merged)
@@ -0,0 +1,166 @@
+"""Sweeps over several axes at once, e.g. GPP bias x amplitude x frequency.
+
+A sweep is a list of Axes. Each axis has its values, a function that sets
+the bench to a value and an estimate of how long that takes. The engine
+runs the axes in the nesting order that spends the least time
+reconfiguring, only touches an axis when its value changes, and returns a
+Dataset with one N-D array per measured quantity in the order the axes were
+given.
+
+Run as a script it measures the frequency response over a GPP bias and
+MFG amplitude grid, taking the read_waveform_mdo.py arguments plus the
+axes below.
+"""
+import time
+from collections import namedtuple
+from contextlib import nullcontext
+
+import numpy as np
+
+from instruments import Session
+import read_waveform_mdo
+from tracing import Tracer
+
+# cost: estimated seconds to move the bench to a new value of the axis
+Axis = namedtuple("Axis", "name values apply cost")
+
+# dims: axis names in the order of the array dimensions
+Dataset = namedtuple("Dataset", "dims coords data")
+
+# read_waveform_mdo.py options that do not fit a dataset over several axes
+UNSUPPORTED = ("output", "resume", "adaptive", "dual", "live", "snapshot")
+
+
+def order_axes(axes):
+    """Nesting order, outermost first, with the least total reconfiguration time.
+
+    The axis at depth k changes prod(n_j, j <= k) times. Swapping two
+    neighbours shows that sorting by cost * n / (n - 1), largest first, is
+    optimal. An axis with a single value is set once and goes outside.
+    """
+    def weight(axis):
+        n = len(axis.values)
+        return np.inf if n < 2 else axis.cost * n / (n - 1)
+    return sorted(axes, key=weight, reverse=True)
+
+
+def reconfiguration_time(order):
+    changes = np.cumprod([len(axis.values) for axis in order])
+    return float(sum(axis.cost * n for axis, n in zip(order, changes)))
+
+
+def run(axes, measure, quantities):
+    """Measure every combination of the axis values.
+
+    measure(point) gets a dict of axis name to value and returns one value
+    per name in quantities.
+    """
+    order = order_axes(axes)
+    print(f'Sweep order {[axis.name for axis in order]}, about {reconfiguration_time(order):.0f} s reconfiguring '
+          f'instead of {reconfiguration_time(axes):.0f} s in the given order')
+    shape = tuple(len(axis.values) for axis in axes)
+    data = {name: np.full(shape, np.nan) for name in quantities}
+    current = {}
+    for index in np.ndindex(*(len(axis.values) for axis in order)):
+        point = {}
+        for axis, i in zip(order, index):
+            if current.get(axis.name) != i:
+                axis.apply(axis.values[i])
+                current[axis.name] = i
+            point[axis.name] = axis.values[i]
+        # Store in the order the axes were given, not the order they ran in
+        position = tuple(index[order.index(axis)] for axis in axes)
+        for name, value in zip(quantities, measure(point)):
+            data[name][position] = value
+    return Dataset(tuple(axis.name for axis in axes), {axis.name: np.asarray(axis.values) for axis in axes}, data)
+
+
+def save(path, dataset):
+    np.savez(path, dims=np.array(dataset.dims),
+             **{f"coord_{name}": values for name, values in dataset.coords.items()}, **dataset.data)
+
+
+def load(path):
+    with np.load(path) as f:
+        dims = tuple(str(name) for name in f["dims"])
+        coords = {name: f[f"coord_{name}"] for name in dims}
+        data = {key: f[key] for key in f.files if key != "dims" and not key.startswith("coord_")}
+    return Dataset(dims, coords, data)
+
+
+def build_parser():
+    parser = read_waveform_mdo.build_parser()
+    parser.description = "Frequency response over a grid of GPP bias and MFG amplitude"
+    parser.add_argument('--bias', type=float, nargs=3, metavar=('MIN', 'MAX', 'STEP'), help='GPP bias voltages to sweep')
+    parser.add_argument('--bias_port', type=int, default=1, help='GPP output port of the bias')
+    parser.add_argument('--bias_settle', type=float, default=0.5, help='Seconds to wait after changing the bias')
+    parser.add_argument('--amplitudes', type=float, nargs='+', help='MFG amplitudes to sweep instead of --amplitude')
+    parser.add_argument('--save', help='Save the dataset to this .npz file')
+    return parser
+
+
+def bode_axes(session, args, scaler):
+    """Bias, amplitude and frequency axes from the arguments."""
+    mfg, gpp = session.mfg, None
+    axes = []
+    if args.bias is not None:
+        gpp = session.gpp
+        gpp.output(args.bias_port)
+
+        def set_bias(voltage):
+            gpp.set_voltage(args.bias_port, voltage)
+            time.sleep(args.bias_settle)
+            # The gain depends on the bias, predict the scales afresh
+            if scaler is not None:
+                scaler.gains.clear()
+        bias_min, bias_max, bias_step = args.bias
+        axes.append(Axis("bias", np.arange(bias_min, bias_max + bias_step * 0.45, bias_step), set_bias,
+                         args.bias_settle + 0.05))
+
+    def set_amplitude(amplitude):
+        mfg.write(f"SOURCE{args.mfg_output_port}:VOLTAGE {amplitude}")
+        if scaler is not None:
+            scaler.amplitude = amplitude
+    axes.append(Axis("amplitude", np.array(args.amplitudes or [args.amplitude]), set_amplitude, 0.05))
+
+    # Includes the wait for the output to settle at the new frequency
+    axes.append(Axis("frequency", read_waveform_mdo.frequency_grid(args),
+                     lambda freq: read_waveform_mdo.set_generator(mfg, freq, args), 0.2))
+    return axes
+
+
+if (__name__ == "__main__"):
+    parser = build_parser()
+    args = parser.parse_args()
+    for name in UNSUPPORTED:
+        if getattr(args, name):
+            parser.error(f"--{name} does not apply to an N-D sweep, save the dataset with --save")
+    read_waveform_mdo.check_args(parser, args)
+
+    tracer = Tracer() if args.trace else None
+    session = Session(args.slab_num, sim=args.sim, timeout=20000, tracer=tracer)
+    mfg, osc = session.mfg, session.mdo
+    read_waveform_mdo.configure(mfg, osc, args)
+    # None with --autoscale
+    scaler = read_waveform_mdo.make_scaler(osc, args)
+
+    def measure(point):
+        # The axes have set the generator, only the scales follow every point
+        if scaler is None:
+            read_waveform_mdo.autoscale(osc)
+        else:
+            scaler.set(point["frequency"])
+        vpp_in, vpp_out, phase_shift = read_waveform_mdo.read_set(osc, point["frequency"], args, scaler)[:3]
+        return vpp_in, vpp_out, phase_shift, 20 * np.log10(vpp_out / vpp_in)
+
+    with tracer.sleeps() if tracer else nullcontext():
+        dataset = run(bode_axes(session, args, scaler), measure, ("vpp_in", "vpp_out", "phase", "gain"))
+    if args.bias is not None:
+        session.gpp.output(args.bias_port, False)
+    if tracer:
+        tracer.report()
+        tracer.save(args.trace)
+    print(dataset.dims)
+    print(dataset.data["gain"])
+    if args.save:
+        save(args.save, dataset)
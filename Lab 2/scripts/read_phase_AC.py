@@ -1,20 +1,10 @@
-import pyvisa
 import argparse
 import time
 
-#Function for checking if tool is available
-def exisiting_tool(lab_num,tool,soccet_num):
-    fung = rm.open_resource("TCPIP::nano-slab-"+str(lab_num)+"-"+tool+".uio.no::"+str(soccet_num)+"::SOCKET")
-    fung.read_termination = '\n'
-    if(tool == "gpp"):
-        pass 
-    else:
-        fung.write_termination = '\n'
-    print(fung.query('*IDN?'))
-    return fung
+from instruments import Session
 
 
-if (__name__ == "__main__"):
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Setting a DC voltage with the power supply (gpp) and reading it with the digital multimeter(gdm)"
     )
@@ -26,15 +16,16 @@ if (__name__ == "__main__"):
     parser.add_argument("--amplitude", required=True, type=float, help="MFG output amplitude")
     parser.add_argument("--offset", required=True, type=float, help="MFG output DC offset")
     parser.add_argument("--phase", required=True, type=float, help="MFG phase difference")
-    
-    args = parser.parse_args()
+    parser.add_argument("--capture", type=str, help="Save both channels' waveform memory to this .npz file")
+    parser.add_argument("--record_length", type=int, default=10000, help="Record length of the capture")
+    parser.add_argument("--sim", nargs="?", const="default", help="Use the simulated bench, optionally configured by a JSON file")
+    return parser
+
 
-    #Invoking the resources
-    rm = pyvisa.ResourceManager()
-    rm.list_resources()
-	
-    mfg = exisiting_tool(args.slab_num,"mfg",1026)
-    osc = exisiting_tool(args.slab_num,"mdo",3000)
+def main(args):
+    session = Session(args.slab_num, sim=args.sim)
+    mfg = session.mfg
+    osc = session.mdo
         
     #Set otuput load of MFG to high impedanze
     mfg.write(f'OUTPUT{args.mfg_output_port}:LOAD INF')
@@ -62,15 +53,16 @@ if (__name__ == "__main__"):
     
     #print('Phase difference: '+str(osc.query('measure:phase?')))
 
-    
-    '''
+
     #Aquire data
-    osc.write(':acquire:mode sample')
-    osc.write(':header ON')
-    osc.write(':acquire:recordlength 1e+4') 
-    
-    while(os.query(':acquire1:state?')==0):
-        time.sleep(10)
-    data = osc.query(':acquire:memory?')
-    
-    '''
\ No newline at end of file
+    if args.capture:
+        import numpy as np
+        from waveform import capture
+
+        wave_in, wave_out = capture(osc, (args.mdo_input_port_in, args.mdo_input_port_out), args.record_length)
+        np.savez(args.capture, time=wave_in.time, v_in=wave_in.volts, v_out=wave_out.volts)
+        print('Saved '+str(wave_in.volts.size)+' points to '+args.capture)
+
+
+if (__name__ == "__main__"):
+    main(build_parser().parse_args())
@@ -1,25 +1,71 @@
-import pyvisa
 import numpy as np
-import time
 import argparse
-import matplotlib.pyplot as plt
+from contextlib import nullcontext
 
-def existing_tool(rm, lab_num, tool, socket_num):
-    fung = rm.open_resource(f"TCPIP::nano-slab-{lab_num}-{tool}.uio.no::{socket_num}::SOCKET")
-    fung.read_termination = '\n'
-    if tool != "gpp":
-        fung.write_termination = '\n'
-    fung.timeout = 20000  # Increase timeout to 20 seconds
-    print(fung.query('*IDN?'))
-    return fung
+from instruments import Session
+from settling import wait_opc, wait_settled
+from scpi_batch import Batch
+from waveform import capture, read_stopped, stop
+from scheduler import Step, run_steps
+from analysis import gain_phase
+from adaptive import adaptive_sweep, margins
+from averaging import collect
+from results import open_results
+from live_plot import open_live
+from scaling import ScaleController, ScaleGroup
+from tracing import Tracer
 
 def calculate_gain(vpp_in, vpp_out):
+    gain = []
     for i in range(len(vpp_in)):
         gain.append(20*np.log10(vpp_out[i]/vpp_in[i]))
     return gain
 
 
-if __name__ == "__main__":
+def plot_point(live, freq, point, series=''):
+    # Hand a measured point to the live view, if there is one, and pass it on
+    if live is not None and point[0] > 0 and point[1] > 0:
+        live.add(freq, 20*np.log10(point[1]/point[0]), point[2], series=series)
+    return point
+
+
+def frequency_grid(args):
+    return np.logspace(np.log10(args.frequency_min), np.log10(args.frequency_max), args.num_points)
+
+
+def confident(args):
+    return args.gain_ci is not None or args.phase_ci is not None
+
+
+def mfg_ports(args):
+    # The second DUT hangs off the other MFG output
+    if args.dual:
+        return (args.mfg_output_port, 3 - args.mfg_output_port)
+    return (args.mfg_output_port,)
+
+
+def channel_pairs(args):
+    """Scope input and output channel of every DUT."""
+    pairs = [(args.mdo_input_port_in, args.mdo_input_port_out)]
+    if args.dual:
+        pairs.append((args.mdo_input_port_in2, args.mdo_input_port_out2))
+    return pairs
+
+
+def capture_channels(args):
+    return tuple(channel for pair in channel_pairs(args) for channel in pair)
+
+
+def result_columns(args):
+    if args.dual:
+        return ('frequency', 'vpp_in1', 'vpp_out1', 'phase1', 'vpp_in2', 'vpp_out2', 'phase2')
+    # The per point uncertainty is recorded when there is one
+    if confident(args) and not args.local:
+        return ('frequency', 'vpp_in', 'vpp_out', 'phase', 'gain_ci', 'phase_ci', 'readings')
+    return ('frequency', 'vpp_in', 'vpp_out', 'phase')
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Measure opamp frequency response")
     parser.add_argument('--slab_num', type=int, required=True, help='Lab number')
     parser.add_argument('--mfg_output_port', type=int, required=True, help='MFG output port')
@@ -30,90 +76,401 @@ if __name__ == "__main__":
     parser.add_argument('--num_points', type=int, required=True, help='Number of sweep points')
     parser.add_argument('--amplitude', type=float, required=True, help='Signal amplitude')
     parser.add_argument('--offset', type=float, required=True, help='Signal offset')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Relative amplitude tolerance for settling')
+    parser.add_argument('--settle_timeout', type=float, default=5, help='Maximum settling time per reading in seconds')
+    parser.add_argument('--local', action='store_true', help='Compute gain and phase from captured waveforms instead of scope measurements')
+    parser.add_argument('--record_length', type=int, default=10000, help='Record length of the captures in --local mode')
+    parser.add_argument('--adaptive', action='store_true', help='Refine the frequency grid around the crossings, --num_points is then the maximum')
+    parser.add_argument('--initial_points', type=int, default=5, help='Points of the coarse grid in --adaptive mode')
+    parser.add_argument('--ugf_tol', type=float, default=0.01, help='Relative unity gain frequency tolerance in --adaptive mode')
+    parser.add_argument('--pm_tol', type=float, default=0.5, help='Phase margin tolerance in degrees in --adaptive mode')
+    parser.add_argument('--gain_ci', type=float, help='Repeat the scope measurements per point until the confidence interval of the gain is within this many dB, not with --local')
+    parser.add_argument('--phase_ci', type=float, help='Likewise for the phase, in degrees')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of --gain_ci and --phase_ci')
+    parser.add_argument('--max_readings', type=int, default=32, help='Most readings per point with --gain_ci or --phase_ci')
+    parser.add_argument('--average', type=int, default=1, help='Scope hardware averaging of the scope measurements, 2 to 256 acquisitions per reading, not with --local, --dual or the confidence targets')
+    parser.add_argument('--dual', action='store_true', help='Also measure a second DUT driven by the other MFG output, from the same captures on a fixed grid, implies --local, not with --adaptive or the confidence targets')
+    parser.add_argument('--mdo_input_port_in2', type=int, default=3, help='MDO input channel for the input of the second DUT with --dual')
+    parser.add_argument('--mdo_input_port_out2', type=int, default=4, help='MDO input channel for the output of the second DUT with --dual')
+    parser.add_argument('--autoscale', action='store_true', help='Autoscale the scope at every point instead of predicting the scales')
+    parser.add_argument('--output', help='Stream every point to this JSON lines result file')
+    parser.add_argument('--resume', action='store_true', help='Continue the --output file, skipping the points it already has')
+    parser.add_argument('--live', action='store_true', help='Plot the points in a window as they are measured')
+    parser.add_argument('--snapshot', action='append', help='Keep this PNG or SVG file up to date with the points measured so far, repeatable, needs no display')
+    parser.add_argument('--trace', help='Save a Chrome trace of the instrument I/O to this JSON file and print the command latencies')
+    parser.add_argument('--sim', nargs='?', const='default', help='Use the simulated bench, optionally configured by a JSON file')
+    return parser
 
-    args = parser.parse_args()
 
-    rm = pyvisa.ResourceManager()
-    rm.list_resources()
+def check_args(parser, args):
+    if args.dual and (args.adaptive or confident(args)):
+        # Both DUTs are fitted from the same captures on a fixed grid
+        parser.error("--dual does not combine with --adaptive, --gain_ci or --phase_ci")
+    if args.average > 1 and (args.local or args.dual):
+        # Every capture stops the scope on a fresh sample mode acquisition
+        parser.error("--average applies to the scope measurements, not to --local or --dual captures")
+    if args.average > 1 and confident(args):
+        # Back to back readings of a running average are not independent
+        parser.error("--gain_ci and --phase_ci need independent readings, they do not combine with --average")
 
-    # Connecting to instruments
-    mfg = existing_tool(rm, args.slab_num, "mfg", 1026)
-    osc = existing_tool(rm, args.slab_num, "mdo", 3000)
 
+def configure(mfg, osc, args):
     # Configure MFG as sine wave generator
-    mfg.write(f"OUTPUT{args.mfg_output_port}:LOAD INF")
-    mfg.write(f"SOURCE{args.mfg_output_port}:FUNCTION SIN")
-    mfg.write(f"SOURCE{args.mfg_output_port}:VOLTAGE {args.amplitude}")
-    mfg.write(f"SOURCE{args.mfg_output_port}:VOLTAGE:OFFSET {args.offset}")
-    mfg.write(f"SOURCE{args.mfg_output_port}:FREQUENCY {args.frequency_min}")
-    
+    with Batch(mfg) as batch:
+        for port in mfg_ports(args):
+            batch.write(f"OUTPUT{port}:LOAD INF")
+            batch.write(f"SOURCE{port}:FUNCTION SIN")
+            batch.write(f"SOURCE{port}:VOLTAGE {args.amplitude}")
+            batch.write(f"SOURCE{port}:VOLTAGE:OFFSET {args.offset}")
+            batch.write(f"SOURCE{port}:FREQUENCY {args.frequency_min}")
+
     # Configure oscilloscope inputs
-    osc.write(f":CHANNEL{args.mdo_input_port_in}:DISPLAY ON")
-    osc.write(f":CHANNEL{args.mdo_input_port_out}:DISPLAY ON")
-    osc.write(":TIMEBASE:SCALE AUTO")
+    with Batch(osc) as batch:
+        for channel in capture_channels(args):
+            batch.write(f":CHANNEL{channel}:DISPLAY ON")
+        batch.write(":TIMEBASE:SCALE AUTO")
+        if args.average > 1:
+            batch.write(":ACQUIRE:MODE AVERAGE")
+            batch.write(f":ACQUIRE:AVERAGE {args.average}")
+
+
+def read_point(osc, args):
+    # Input amplitude, output amplitude and phase in one round trip
+    batch = Batch(osc)
+    batch.write(f":MEASure:SOURce1 CHANnel{args.mdo_input_port_in}")
+    batch.query(":MEASure:amplitude?")
+    batch.write(f":MEASure:SOURce1 CHANnel{args.mdo_input_port_out}")
+    batch.query(":MEASure:amplitude?")
+    batch.write(f":MEASure:SOURce1 CHANnel{args.mdo_input_port_in}")
+    batch.write(f":MEASure:SOURce2 CHANnel{args.mdo_input_port_out}")
+    batch.query(":MEASure:phase?")
+    vpp_in_val, vpp_out_val, phase_query_result = batch.send()
+    phase_value = float(phase_query_result) if phase_query_result.strip() != '?' else np.nan
+    return float(vpp_in_val), float(vpp_out_val), phase_value
+
+
+def set_generator(mfg, freq, args):
+    with Batch(mfg) as batch:
+        for port in mfg_ports(args):
+            batch.write(f"SOURCE{port}:FREQUENCY {freq}")
+    # Wait for output signal to settle
+    wait_opc(mfg)
+
+
+def autoscale(osc):
+    osc.write(":AUTOSCALE")
+    wait_opc(osc)
+
+
+def make_scaler(osc, args):
+    # None autoscales at every point
+    if args.autoscale:
+        return None
+    controllers = [ScaleController(osc, channel_in, channel_out, args.amplitude, args.offset)
+                   for channel_in, channel_out in channel_pairs(args)]
+    return controllers[0] if len(controllers) == 1 else ScaleGroup(controllers)
+
+
+def scales_ok(scaler, freq, waves):
+    # Captured in the order of capture_channels()
+    return scaler is None or scaler.check(freq, *(np.ptp(wave.volts) for wave in waves))
+
+
+def set_frequency(mfg, osc, freq, args, scaler=None):
+    set_generator(mfg, freq, args)
+    if scaler is None:
+        autoscale(osc)
+    else:
+        scaler.set(freq)
+
+
+def settle_output(osc, args):
+    # Without an autoscale in between the output may still be settling, wait until its amplitude stops moving
+    osc.write(f":MEASure:SOURce1 CHANnel{args.mdo_input_port_out}")
+    wait_settled(lambda: float(osc.query(":MEASure:amplitude?")), rel_tol=args.tolerance, timeout=args.settle_timeout)
+
+
+# Readings taken again after a clipped or under-ranged one before it is accepted anyway
+RETRIES = 2
+
+
+def measure_point(mfg, osc, freq, args, scaler=None):
+    """Vpp in, Vpp out and phase at one frequency from the scope measurements,
+    followed by their uncertainty when the arguments ask for it."""
+    set_frequency(mfg, osc, freq, args, scaler)
+    if confident(args):
+        return read_confident(osc, freq, args, scaler)
+    return read_settled(osc, freq, args, scaler)
+
+
+def read_settled(osc, freq, args, scaler=None):
+    for attempt in range(RETRIES + 1):
+        # Measure input voltage, output voltage and phase difference until the output amplitude settles
+        point = wait_settled(
+            lambda: read_point(osc, args), rel_tol=args.tolerance, timeout=args.settle_timeout, key=lambda point: point[1]
+        )
+        if scaler is None or scaler.check(freq, point[0], point[1]):
+            break
+    return point
+
+
+def read_confident(osc, freq, args, scaler=None):
+    """Vpp in, Vpp out and phase averaged until gain and phase are within
+    args.gain_ci and args.phase_ci, their interval half widths and the
+    number of readings."""
+    first = read_settled(osc, freq, args, scaler)
+
+    def read():
+        vpp_in, vpp_out, phase = read_point(osc, args)
+        # Keep the phase on the side of the first reading near +-180 degrees
+        phase = first[2] + (phase - first[2] + 180) % 360 - 180
+        return 20 * np.log10(vpp_out / vpp_in), phase, vpp_in, vpp_out
+
+    estimate = collect(read, (args.gain_ci, args.phase_ci, None, None), args.confidence, max_count=args.max_readings)
+    gain, phase, vpp_in, vpp_out = estimate.mean
+    print(f'{freq:.4g} Hz: {gain:.2f} +- {estimate.ci[0]:.2g} dB, {phase:.1f} +- {estimate.ci[1]:.2g} degrees, '
+          f'{estimate.count} readings')
+    return vpp_in, vpp_out, phase, estimate.ci[0], estimate.ci[1], estimate.count
+
+
+def capture_point(mfg, osc, freq, args, scaler=None):
+    set_frequency(mfg, osc, freq, args, scaler)
+    return capture_set(osc, freq, args, scaler)
+
+
+def capture_set(osc, freq, args, scaler=None):
+    # Capture at the frequency the generator and the scales are already set to
+    if scaler is not None:
+        settle_output(osc, args)
+    for attempt in range(RETRIES + 1):
+        waves = capture(osc, capture_channels(args), args.record_length)
+        if scales_ok(scaler, freq, waves):
+            break
+    return waves
+
+
+def overlapped_captures(mfg, osc, frequencies, args, scaler=None):
+    """Capture every frequency, setting the next one while the scope is read out.
+
+    Once the scope is stopped its memory holds the point, so the MFG can
+    move on while the channels download. Points whose capture fails the
+    scale check are captured again at the end.
+    """
+    channels = capture_channels(args)
+    retake = []
+
+    def acquire(freq):
+        if scaler is None:
+            autoscale(osc)
+        else:
+            scaler.set(freq)
+            settle_output(osc, args)
+        stop(osc, args.record_length)
+
+    def read(i, freq):
+        waves = read_stopped(osc, channels)
+        if not scales_ok(scaler, freq, waves):
+            retake.append(i)
+        return waves
+
+    steps = []
+    for i, freq in enumerate(frequencies):
+        steps.append(Step(f"frequency{i}", lambda freq=freq: set_generator(mfg, freq, args), ("mfg",),
+                          (f"stop{i-1}",) if i else ()))
+        steps.append(Step(f"stop{i}", lambda freq=freq: acquire(freq), ("mdo",), (f"frequency{i}",)))
+        steps.append(Step(f"read{i}", lambda i=i, freq=freq: read(i, freq), ("mdo",), (f"stop{i}",)))
+    results = run_steps(steps)
+    captures = [results[f"read{i}"] for i in range(len(frequencies))]
+    for i in retake:
+        captures[i] = capture_point(mfg, osc, frequencies[i], args, scaler)
+    return captures
+
+
+def analyse_captures(captures, frequencies, pair=0):
+    # Fit all captures in one vectorized pass, pair picks the DUT of a --dual capture
+    response = gain_phase(
+        np.array([waves[2 * pair].time for waves in captures]),
+        np.array([waves[2 * pair].volts for waves in captures]),
+        np.array([waves[2 * pair + 1].volts for waves in captures]),
+        frequencies,
+    )
+    print('THD: '+str(response.thd))
+    return list(response.vpp_in), list(response.vpp_out), list(response.phase)
+
+
+def measure(mfg, osc, freq, args, scaler=None):
+    # One point by whichever method the sweep uses
+    set_frequency(mfg, osc, freq, args, scaler)
+    return read_set(osc, freq, args, scaler)
+
+
+def read_set(osc, freq, args, scaler=None):
+    """measure() at the frequency the generator and the scales are already set to."""
+    if args.local:
+        vpp_in, vpp_out, phase_shift = analyse_captures([capture_set(osc, freq, args, scaler)], np.array([freq]))
+        return vpp_in[0], vpp_out[0], phase_shift[0]
+    if confident(args):
+        return read_confident(osc, freq, args, scaler)
+    return read_settled(osc, freq, args, scaler)
+
+
+def measure_dual(mfg, osc, freq, args, scaler=None):
+    # Both DUTs from one capture, flattened for the result file
+    waves = capture_point(mfg, osc, freq, args, scaler)
+    return tuple(value[0] for pair in range(2) for value in analyse_captures([waves], np.array([freq]), pair))
+
+
+def dual_bode_sweep(mfg, osc, frequencies, args, store=None, live=None):
+    """Frequency response of both DUTs, each frequency captured once on all four channels.
+
+    Returns (vpp_in, vpp_out, phase_shift) lists for each DUT.
+    """
+    scaler = make_scaler(osc, args)
+    if store is not None:
+        points = []
+        for freq in frequencies:
+            point = store.point(freq, lambda: measure_dual(mfg, osc, freq, args, scaler))
+            plot_point(live, freq, point[:3], 'DUT 1')
+            plot_point(live, freq, point[3:], 'DUT 2')
+            points.append(point)
+        columns = [list(column) for column in zip(*points)]
+        return [columns[:3], columns[3:]]
+    captures = overlapped_captures(mfg, osc, frequencies, args, scaler)
+    duts = [analyse_captures(captures, frequencies, pair) for pair in range(2)]
+    for pair, dut in enumerate(duts):
+        for freq, *point in zip(frequencies, *dut):
+            plot_point(live, freq, point, f'DUT {pair + 1}')
+    return duts
+
+
+def bode_sweep(mfg, osc, frequencies, args, store=None, live=None):
+    """Measure the frequency response at each frequency.
+
+    With a store (results.ResultFile) each point is recorded as soon as it
+    is measured and points already in it are skipped. Points also go to
+    live (live_plot.LivePlot) as they are measured. Returns the lists of
+    input Vpp, output Vpp and phase shift.
+    """
+    scaler = make_scaler(osc, args)
+    if store is not None:
+        points = [plot_point(live, freq, store.point(freq, lambda: measure(mfg, osc, freq, args, scaler)))
+                  for freq in frequencies]
+        vpp_in, vpp_out, phase_shift = (list(column) for column in list(zip(*points))[:3])
+        return vpp_in, vpp_out, phase_shift
+
+    if args.local:
+        # One acquisition per point, analysed after the sweep
+        captures = overlapped_captures(mfg, osc, frequencies, args, scaler)
+        vpp_in, vpp_out, phase_shift = analyse_captures(captures, frequencies)
+        for freq, *point in zip(frequencies, vpp_in, vpp_out, phase_shift):
+            plot_point(live, freq, point)
+        return vpp_in, vpp_out, phase_shift
 
-    # Frequency sweep setup
-    frequencies = np.logspace(np.log10(args.frequency_min), np.log10(args.frequency_max), args.num_points)
     vpp_in = []
     vpp_out = []
     phase_shift = []
-    gain = []
-
     for freq in frequencies:
-        mfg.write(f"SOURCE{args.mfg_output_port}:FREQUENCY {freq}")
-        # Wait for output signal to settle
-        time.sleep(2)  # Adjust this delay as necessary
-
-        # Autoscale oscilloscope
-        osc.write(":AUTOSCALE")
-        time.sleep(1)  # Allow oscilloscope to autoscale
-
-        # Measure input voltage
-        osc.write(f":MEASure:SOURce1 CHANnel{args.mdo_input_port_in}")
-        time.sleep(0.5)
-        vpp_in_val = float(osc.query(":MEASure:amplitude?"))
-
-        # Measure output voltage
-        osc.write(f":MEASure:SOURce1 CHANnel{args.mdo_input_port_out}")
-        time.sleep(0.5)
-        vpp_out_val = float(osc.query(":MEASure:amplitude?"))
-
-        
-
-        # Measure phase difference directly if the oscilloscope supports it
-        # Measure phase difference
-        osc.write(f":MEASure:SOURce1 CHANnel{args.mdo_input_port_in}")
-        osc.write(f":MEASure:SOURce2 CHANnel{args.mdo_input_port_out}")
-        time.sleep(0.5)
-        phase_query_result = osc.query(":MEASure:phase?")
-        phase_value = float(phase_query_result) if phase_query_result.strip() != '?' else np.nan
-
+        vpp_in_val, vpp_out_val, phase_value = plot_point(live, freq, measure_point(mfg, osc, freq, args, scaler))[:3]
         vpp_in.append(vpp_in_val)
         vpp_out.append(vpp_out_val)
         phase_shift.append(phase_value)
+    return vpp_in, vpp_out, phase_shift
+
+
+def frequency_response(mfg, osc, args, store=None, live=None):
+    """Run the stepped or adaptive sweep the arguments ask for.
+
+    Returns the frequencies, input Vpp, output Vpp and phase shift.
+    """
+    if args.adaptive:
+        scaler = make_scaler(osc, args)
+        measure_freq = lambda freq: measure(mfg, osc, freq, args, scaler)
+        if store is not None:
+            measure_freq = lambda freq: store.point(freq, lambda: measure(mfg, osc, freq, args, scaler))
+        return adaptive_sweep(
+            lambda freq: plot_point(live, freq, measure_freq(freq)), args.frequency_min, args.frequency_max,
+            initial_points=args.initial_points, max_points=args.num_points, ugf_tol=args.ugf_tol, pm_tol=args.pm_tol,
+        )
+    frequencies = frequency_grid(args)
+    vpp_in, vpp_out, phase_shift = bode_sweep(mfg, osc, frequencies, args, store, live)
+    return frequencies, vpp_in, vpp_out, phase_shift
+
 
-    gain = calculate_gain(vpp_in, vpp_out)
-    gain = np.array(gain)
-    phase_shift = np.array(phase_shift)
+def dut_responses(mfg, osc, args, store=None, live=None):
+    """Frequencies and (vpp_in, vpp_out, phase_shift) of every DUT, two with --dual."""
+    if args.dual:
+        frequencies = frequency_grid(args)
+        return frequencies, dual_bode_sweep(mfg, osc, frequencies, args, store, live)
+    frequencies, vpp_in, vpp_out, phase_shift = frequency_response(mfg, osc, args, store, live)
+    return frequencies, [(vpp_in, vpp_out, phase_shift)]
 
-    unity_gain_freq = frequencies[np.argmin(np.abs(gain))]
-    phase_margin = 180 + np.interp(unity_gain_freq, frequencies, phase_shift)
 
+def stability(frequencies, gain, phase_shift):
+    # Fitted phases lie in (-180, 180], a wrap before the crossing would be interpolated across
+    phase_shift = np.unwrap(phase_shift, period=360)
+    unity_gain_freq, phase_margin = margins(frequencies, gain, phase_shift)
+    if unity_gain_freq is None:
+        # No 0 dB crossing in the sweep, take the point closest to it
+        unity_gain_freq = frequencies[np.argmin(np.abs(gain))]
+        phase_margin = 180 + np.interp(unity_gain_freq, frequencies, phase_shift)
+    return unity_gain_freq, phase_margin
+
+
+def main(args):
+    # Connecting to instruments
+    tracer = Tracer() if args.trace else None
+    session = Session(args.slab_num, sim=args.sim, timeout=20000, tracer=tracer)  # Increase timeout to 20 seconds
+    mfg = session.mfg
+    osc = session.mdo
+    with tracer.sleeps() if tracer else nullcontext():
+        configure(mfg, osc, args)
+        store = open_results(args, result_columns(args), session)
+        live = open_live(args, "bode")
+        frequencies, duts = dut_responses(mfg, osc, args, store, live)
+    if store is not None:
+        store.close()
+    if live is not None:
+        live.close()
+    if tracer:
+        tracer.report()
+        tracer.save(args.trace)
+
+    # matplotlib takes long to import, so only once there is something to plot
+    import matplotlib.pyplot as plt
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
-    ax1.semilogx(frequencies, gain, label='Gain')
+    for i, (vpp_in, vpp_out, phase_shift) in enumerate(duts):
+        gain = calculate_gain(vpp_in, vpp_out)
+        gain = np.array(gain)
+        phase_shift = np.array(phase_shift)
+
+        unity_gain_freq, phase_margin = stability(frequencies, gain, phase_shift)
+        dut = f'DUT {i + 1} ' if args.dual else ''
+        if args.dual:
+            print(f'{dut}unity gain frequency {unity_gain_freq:.4g} Hz, phase margin {phase_margin:.1f} degrees')
+
+        line, = ax1.semilogx(frequencies, gain, label=f'{dut}Gain')
+        ax1.axvline(unity_gain_freq, color='r' if not args.dual else line.get_color(), linestyle='--',
+                    label=f'{dut}Unity Gain Freq: {unity_gain_freq:.2f} Hz')
+        line, = ax2.semilogx(frequencies, phase_shift, label=f'{dut}Phase Shift')
+        ax2.axhline(phase_margin, color='g' if not args.dual else line.get_color(), linestyle='--',
+                    label=f'{dut}Phase Margin: {phase_margin:.2f} degrees')
     ax1.set_title('Bode Plot')
     ax1.set_xlabel('Frequency [Hz]')
     ax1.set_ylabel('Gain [dB]')
-    ax1.axvline(unity_gain_freq, color='r', linestyle='--', label=f'Unity Gain Freq: {unity_gain_freq:.2f} Hz')
     ax1.legend()
     ax1.grid(True)
 
-    ax2.semilogx(frequencies, phase_shift, label='Phase Shift')
     ax2.set_xlabel('Frequency [Hz]')
     ax2.set_ylabel('Phase Shift [Degrees]')
-    ax2.axhline(phase_margin, color='g', linestyle='--', label=f'Phase Margin: {phase_margin:.2f} degrees')
     ax2.legend()
     ax2.grid(True)
 
     plt.tight_layout()
     plt.show()
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    main(args)
@@ -0,0 +1,131 @@
+"""Append-only result files so long sweeps survive a crash.
+
+A result file is JSON lines. A header line records the sweep arguments,
+the instrument IDNs and the start time, then every measured point is
+appended and flushed to disk as soon as it is done. Resuming appends a
+new header and skips the points that are already in the file.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+
+def _key(value):
+    # Setpoints are recomputed on resume, compare them to 10 significant digits
+    return float(f"{float(value):.10g}")
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _plain(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ResultFile:
+    """Streams sweep points to path.
+
+    columns names the values of a point, the first one is the setpoint the
+    point is looked up by on resume.
+    """
+
+    def __init__(self, path, columns, args=None, session=None, resume=False):
+        self.path = path
+        self.columns = tuple(columns)
+        self.points = {}
+        if os.path.exists(path):
+            if not resume:
+                raise FileExistsError(f"{path} already exists, use --resume to continue it")
+            headers, rows = read(path)
+            if headers and headers[0]["columns"] != list(self.columns):
+                raise ValueError(f"{path} has columns {headers[0]['columns']}, expected {list(self.columns)}")
+            for row in rows:
+                self.points[_key(row[0])] = tuple(row[1:])
+            print(f"Resuming {path}: {len(self.points)} points recorded")
+        self.file = open(path, "a")
+        if self.file.tell() and not _ends_with_newline(path):
+            # Terminate a line cut short by a crash
+            self.file.write("\n")
+        self._write({
+            "type": "resume" if self.points else "header",
+            "columns": list(self.columns),
+            "time": time.time(),
+            "args": vars(args) if args is not None else None,
+            "idn": {name: handle.idn for name, handle in session.tools.items()} if session is not None else None,
+        })
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def __contains__(self, setpoint):
+        return _key(setpoint) in self.points
+
+    def get(self, setpoint):
+        return self.points[_key(setpoint)]
+
+    def append(self, setpoint, values):
+        values = tuple(_plain(v) for v in values)
+        self.points[_key(setpoint)] = values
+        self._write({"type": "point", "time": time.time(), "values": [_plain(setpoint), *values]})
+
+    def point(self, setpoint, measure):
+        """The recorded values at setpoint, or measure() recorded now."""
+        if setpoint in self:
+            return self.get(setpoint)
+        values = measure()
+        self.append(setpoint, values)
+        return values
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read(path):
+    """Headers and point rows of a result file.
+
+    A line cut short by a crash is ignored.
+    """
+    headers = []
+    rows = []
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["type"] == "point":
+                rows.append(record["values"])
+            else:
+                headers.append(record)
+    return headers, rows
+
+
+def load(path):
+    """Headers and a dict of column arrays, sorted by setpoint."""
+    headers, rows = read(path)
+    columns = headers[0]["columns"]
+    data = np.array(rows, dtype=float).reshape(-1, len(columns))
+    data = data[np.argsort(data[:, 0], kind="stable")]
+    return headers, {name: data[:, i] for i, name in enumerate(columns)}
+
+
+def open_results(args, columns, session):
+    """The ResultFile for --output, or None when the sweep is not recorded."""
+    if not args.output:
+        return None
+    return ResultFile(args.output, columns, args=args, session=session, resume=args.resume)
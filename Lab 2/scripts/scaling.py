@@ -0,0 +1,153 @@
+"""Scope scales predicted from the known stimulus instead of autoscaling.
+
+Autoscale is the slowest thing the MDO does at every point of a frequency
+sweep. The input amplitude is set on the MFG, the output amplitude follows
+from the gain measured at the neighbouring points and the timebase from the
+frequency, so the scales can be written directly. Autoscale is only used
+when there is nothing to predict from yet or a reading comes back clipped.
+"""
+import numpy as np
+
+from scpi_batch import Batch
+from settling import wait_opc
+
+# MDO scales per division in a 1-2-5 sequence
+VERTICAL = (np.array([1, 2, 5]) * 10.0**np.arange(-3, 2)[:, None]).ravel()  # 1 mV to 50 V
+HORIZONTAL = (np.array([1, 2, 5]) * 10.0**np.arange(-9, 2)[:, None]).ravel()  # 1 ns to 50 s
+
+FILL = 5  # Divisions a predicted signal should span, of the 8 on screen
+CLIPPED = 9.5  # The scope digitises 10 divisions, a reading this tall has hit both edges
+UNDER_RANGE = 1.5  # A reading smaller than this many divisions wastes resolution
+
+
+def step_at_least(steps, value):
+    return steps[min(np.searchsorted(steps, value), steps.size - 1)]
+
+
+def vertical_scale(vpp):
+    return step_at_least(VERTICAL, vpp / FILL)
+
+
+def horizontal_scale(frequency, periods=4):
+    # Ten divisions across the screen
+    return step_at_least(HORIZONTAL, periods / frequency / 10)
+
+
+class ScaleController:
+    """Keeps the input and output channels scaled for the next frequency.
+
+    set(frequency) before a reading, check(frequency, vpp_in, vpp_out)
+    after it. A reading that fails the check has to be taken again.
+    """
+
+    def __init__(self, osc, channel_in, channel_out, amplitude, offset=0.0, periods=4):
+        self.osc = osc
+        self.channel_in = channel_in
+        self.channel_out = channel_out
+        self.amplitude = amplitude
+        self.offset = offset
+        self.periods = periods
+        self.gains = {}
+        self.scales = {}
+        self.offset_out = 0.0
+        self.autoscales = 0
+
+    def predict(self, frequency):
+        """Expected output Vpp, from the two measured frequencies closest to it
+        in log-log. None before the first point."""
+        if not self.gains:
+            return None
+        known = np.array(sorted(self.gains))
+        nearest = known[np.argsort(np.abs(np.log(known / frequency)))[:2]]
+        gains = np.array([self.gains[f] for f in nearest])
+        if nearest.size < 2:
+            return self.amplitude * gains[0]
+        slope = np.log(gains[1] / gains[0]) / np.log(nearest[1] / nearest[0])
+        return self.amplitude * gains[0] * (frequency / nearest[0])**slope
+
+    def set(self, frequency):
+        vpp_out = self.predict(frequency)
+        if vpp_out is None:
+            self.autoscale()
+        else:
+            self.apply(frequency, self.amplitude, vpp_out)
+
+    def apply(self, frequency, vpp_in, vpp_out):
+        self.scales = {self.channel_in: vertical_scale(vpp_in), self.channel_out: vertical_scale(vpp_out)}
+        with Batch(self.osc) as batch:
+            batch.write(f':CHANnel{self.channel_in}:SCALe {self.scales[self.channel_in]:g}')
+            batch.write(f':CHANnel{self.channel_in}:OFFSet {-self.offset:g}')
+            batch.write(f':CHANnel{self.channel_out}:SCALe {self.scales[self.channel_out]:g}')
+            batch.write(f':CHANnel{self.channel_out}:OFFSet {-self.offset_out:g}')
+            batch.write(f':TIMebase:SCALe {horizontal_scale(frequency, self.periods):g}')
+        wait_opc(self.osc)
+
+    def autoscale(self):
+        self.osc.write(':AUTOSet')
+        wait_opc(self.osc, timeout=15)
+        self.autoscales += 1
+        self.refresh()
+
+    def refresh(self):
+        # Keep the scales the scope has for the checks and the output's DC level for later points
+        with Batch(self.osc) as batch:
+            batch.query(f':CHANnel{self.channel_in}:SCALe?')
+            batch.query(f':CHANnel{self.channel_out}:SCALe?')
+            batch.query(f':CHANnel{self.channel_out}:OFFSet?')
+        scale_in, scale_out, offset_out = (float(reply) for reply in batch.replies)
+        self.scales = {self.channel_in: scale_in, self.channel_out: scale_out}
+        self.offset_out = -offset_out
+
+    def check(self, frequency, vpp_in, vpp_out):
+        """Whether a reading taken at the current scales can be trusted.
+
+        A clipped channel is autoscaled, an under-ranged one rescaled from
+        the reading. Good readings feed the gain prediction.
+        """
+        readings = ((self.channel_in, vpp_in), (self.channel_out, vpp_out))
+        if any(vpp >= CLIPPED * self.scales[channel] for channel, vpp in readings):
+            self.autoscale()
+            return False
+        if any(vpp < UNDER_RANGE * self.scales[channel] and vertical_scale(vpp) < self.scales[channel]
+               for channel, vpp in readings):
+            self.apply(frequency, vpp_in, vpp_out)
+            return False
+        if vpp_in > 0 and vpp_out > 0:
+            self.gains[frequency] = vpp_out / vpp_in
+        return True
+
+
+class ScaleGroup:
+    """ScaleControllers of several input and output pairs on one scope, like
+    two DUTs on four channels.
+
+    Same interface as a single controller with the Vpp of every pair in
+    turn. An autoscale rescales every channel, so after one all
+    controllers read their scales back.
+    """
+
+    def __init__(self, controllers):
+        self.controllers = controllers
+
+    def _autoscaled(self, before):
+        if sum(c.autoscales for c in self.controllers) > before:
+            for controller in self.controllers:
+                controller.refresh()
+
+    def set(self, frequency):
+        before = sum(c.autoscales for c in self.controllers)
+        if any(c.predict(frequency) is None for c in self.controllers):
+            # One autoscale for all of them
+            self.controllers[0].autoscale()
+        else:
+            for controller in self.controllers:
+                controller.set(frequency)
+        self._autoscaled(before)
+
+    def check(self, frequency, *vpps):
+        before = sum(c.autoscales for c in self.controllers)
+        # Every pair is checked, so all of them learn from the reading
+        good = [c.check(frequency, vpp_in, vpp_out)
+                for c, vpp_in, vpp_out in zip(self.controllers, vpps[::2], vpps[1::2])]
+        self._autoscaled(before)
+        return all(good)
@@ -0,0 +1,52 @@
+"""Run the steps of a sweep concurrently where the instruments allow it.
+
+Every step declares the tools it talks to and the steps it has to wait
+for. A step starts as soon as its dependencies are done and none of its
+tools is busy, so steps on different instruments overlap while the
+commands sent to any one instrument keep the order they were declared in.
+"""
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# run() takes no arguments, its return value is kept under name.
+# tools: tool names the step uses, after: names of steps it waits for
+Step = namedtuple("Step", "name run tools after", defaults=((), ()))
+
+
+def run_steps(steps, max_workers=4):
+    """Run steps and return their results by name.
+
+    An exception in a step is raised once the steps already running have
+    finished; steps that have not started are dropped.
+    """
+    steps = list(steps)
+    names = {step.name for step in steps}
+    for step in steps:
+        missing = set(step.after) - names
+        if missing:
+            raise ValueError(f"Step {step.name} waits for unknown steps {sorted(missing)}")
+
+    results = {}
+    pending = steps
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            claimed = set()
+            for tools in (step.tools for step in running.values()):
+                claimed.update(tools)
+            waiting = []
+            for step in pending:
+                if claimed.isdisjoint(step.tools) and all(name in results for name in step.after):
+                    running[pool.submit(step.run)] = step
+                else:
+                    waiting.append(step)
+                # Later steps on the same tools wait for this one
+                claimed.update(step.tools)
+            pending = waiting
+            if not running:
+                raise ValueError(f"Steps {[step.name for step in pending]} can never start")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                results[step.name] = future.result()
+    return results
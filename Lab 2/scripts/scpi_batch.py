@@ -0,0 +1,55 @@
+def _separate(response, count, tool):
+    # Replies to a compound query are separated by ';', but some tools
+    # answer each query on its own line instead
+    parts = response.split(';')
+    while len(parts) < count:
+        parts += tool.resource.read().split(';')
+    if len(parts) != count:
+        raise ValueError(f"Expected {count} replies, got {len(parts)}: {parts}")
+    return parts
+
+
+class Batch:
+    """Collects SCPI commands and sends them as one ';' joined message.
+
+    Queries are answered in the order they were added:
+
+        with Batch(osc) as batch:
+            batch.write(':MEASure:SOURce1 CH1')
+            batch.query(':MEASure:amplitude?')
+        vpp, = batch.replies
+    """
+
+    def __init__(self, tool):
+        self.tool = tool
+        self.commands = []
+        self.queries = 0
+        self.replies = []
+
+    def write(self, command):
+        self.commands.append(command)
+        return self
+
+    def query(self, command):
+        self.commands.append(command)
+        self.queries += 1
+        return self
+
+    def send(self):
+        # A leading ':' resets the command tree between joined commands
+        message = ';'.join(c if c.startswith(('*', ':')) else ':' + c for c in self.commands)
+        if self.queries:
+            self.replies = _separate(self.tool.query(message), self.queries, self.tool)
+        elif message:
+            self.tool.write(message)
+        self.commands = []
+        self.queries = 0
+        return self.replies
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.send()
+
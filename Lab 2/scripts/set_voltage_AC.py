@@ -1,20 +1,10 @@
-import pyvisa
 import argparse
 import time
 
-#Function for checking if tool is available
-def exisiting_tool(lab_num,tool,soccet_num):
-    fung = rm.open_resource("TCPIP::nano-slab-"+str(lab_num)+"-"+tool+".uio.no::"+str(soccet_num)+"::SOCKET")
-    fung.read_termination = '\n'
-    if(tool == "gpp"):
-        pass 
-    else:
-        fung.write_termination = '\n'
-    print(fung.query('*IDN?'))
-    return fung
+from instruments import Session
 
 
-if (__name__ == "__main__"):
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Setting a DC voltage with the power supply (gpp) and reading it with the digital multimeter(gdm)"
     )
@@ -24,15 +14,16 @@ if (__name__ == "__main__"):
     parser.add_argument("--frequency", required=True, type=float, help="MFG output frequency")
     parser.add_argument("--amplitude", required=True, type=float, help="MFG output amplitude")
     parser.add_argument("--offset", required=True, type=float, help="MFG output DC offset")
-    
-    args = parser.parse_args()
+    parser.add_argument("--capture", type=str, help="Save the channel's waveform memory to this .npz file")
+    parser.add_argument("--record_length", type=int, default=10000, help="Record length of the capture")
+    parser.add_argument("--sim", nargs="?", const="default", help="Use the simulated bench, optionally configured by a JSON file")
+    return parser
+
 
-    #Invoking the resources
-    rm = pyvisa.ResourceManager()
-    rm.list_resources()
-	
-    mfg = exisiting_tool(args.slab_num,"mfg",1026)
-    osc = exisiting_tool(args.slab_num,"mdo",3000)
+def main(args):
+    session = Session(args.slab_num, sim=args.sim)
+    mfg = session.mfg
+    osc = session.mdo
         
     #Set otuput load of MFG to high impedanze
     mfg.write('output'+str(args.mfg_output_port)+':load inf')
@@ -62,15 +53,17 @@ if (__name__ == "__main__"):
     osc.write(':measure:source2 CH'+str(args.mdo_input_port_2)) #eg CH2
     print(osc.query('measure:phase?')
     '''
-    
-    '''
+
     #Aquire data
-    osc.write(':acquire:mode sample')
-    osc.write(':header ON')
-    osc.write(':acquire:recordlength 1e+4') 
-    
-    while(os.query(':acquire1:state?')==0):
-        time.sleep(10)
-    data = osc.query(':acquire:memory?')
-    
-    '''
\ No newline at end of file
+    if args.capture:
+        # numpy only for captures, setting the generator is quick without it
+        import numpy as np
+        from waveform import capture
+
+        wave, = capture(osc, (args.mdo_input_port,), args.record_length)
+        np.savez(args.capture, time=wave.time, volts=wave.volts)
+        print('Saved '+str(wave.volts.size)+' points to '+args.capture)
+
+
+if (__name__ == "__main__"):
+    main(build_parser().parse_args())
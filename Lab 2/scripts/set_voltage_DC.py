@@ -1,35 +1,24 @@
-import pyvisa
-import time
-import numpy as np
 import argparse
 
-#Checking of tool is available
-def exisiting_tool(lab_num,tool,soccet_num):
-    fung = rm.open_resource("TCPIP::nano-slab-"+str(lab_num)+"-"+tool+".uio.no::"+str(soccet_num)+"::SOCKET")
-    fung.read_termination = '\n'
-    if(tool == "gpp"):
-        pass 
-    else:
-        fung.write_termination = '\n'
-    print(fung.query('*IDN?'))
-    return fung
+from instruments import Session
 
-if (__name__ == "__main__"):
+
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Setting a DC voltage with the power supply (gpp) and reading it with the digital multimeter(gdm)"
     )
     parser.add_argument("--slab_num", required=True, type=int, help="Lab space number between 1 and 6")
     parser.add_argument("--voltage1", required=True, type=float, help="Voltage for output 1")
     parser.add_argument("--voltage2", required=True, type=float, help="Voltage for output 2")
-    args = parser.parse_args()
+    parser.add_argument("--sim", nargs="?", const="default", help="Use the simulated bench, optionally configured by a JSON file")
+    return parser
 
-    #Invoking the resources
-    rm = pyvisa.ResourceManager()
-    rm.list_resources()
 
-    #Check if tools are available:    
-    dcpp = exisiting_tool(args.slab_num,"gpp",1026)
-    dmm  = exisiting_tool(args.slab_num,"gdm",3001)
+def main(args):
+    #Check if tools are available:
+    session = Session(args.slab_num, sim=args.sim)
+    dcpp = session.gpp
+    dmm  = session.gdm
 
     #Set DC voltage for each of the two channels:
     dcpp.write('VSET1:'+str(args.voltage1)) #This works
@@ -47,3 +36,6 @@ if (__name__ == "__main__"):
     #Measuring the set voltages:
     print(dmm.query('measure:voltage:DC?'))
 
+
+if (__name__ == "__main__"):
+    main(build_parser().parse_args())
@@ -0,0 +1,46 @@
+import time
+
+# Tools that answer *OPC? once pending operations are done, the GPP does not
+OPC_TOOLS = {"mdo", "mfg", "gdm"}
+
+
+def wait_opc(tool, timeout=10, fallback=1):
+    """Block until the tool reports its pending operations complete.
+
+    Tools without *OPC? support just wait fallback seconds.
+    """
+    if tool.name not in OPC_TOOLS:
+        time.sleep(fallback)
+        return False
+    resource = tool.resource
+    old_timeout = resource.timeout
+    resource.timeout = timeout * 1000
+    try:
+        return tool.query('*OPC?').strip() == '1'
+    finally:
+        resource.timeout = old_timeout
+
+
+def converged(values, abs_tol, rel_tol):
+    spread = max(values) - min(values)
+    return spread <= max(abs_tol, rel_tol * max(abs(v) for v in values))
+
+
+def wait_settled(read, abs_tol=1e-3, rel_tol=0.0, count=3, interval=0.1, timeout=15, key=None):
+    """Poll read() until count successive readings agree within tolerance.
+
+    key picks the value to compare when read() returns several values.
+    Returns the last reading. If the readings do not settle before
+    timeout seconds a warning is printed and the last reading is returned.
+    """
+    key = key if key is not None else (lambda value: value)
+    deadline = time.perf_counter() + timeout
+    values = [read()]
+    while True:
+        if len(values) >= count and converged([key(v) for v in values[-count:]], abs_tol, rel_tol):
+            return values[-1]
+        if time.perf_counter() >= deadline:
+            print(f'Not settled after {timeout} s, last readings: {values[-count:]}')
+            return values[-1]
+        time.sleep(interval)
+        values.append(read())
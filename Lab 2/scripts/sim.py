@@ -0,0 +1,560 @@
+"""Simulated lab bench standing in for the MFG, MDO, GDM and GPP.
+
+SimResourceManager replaces pyvisa.ResourceManager and hands out
+resources that answer the SCPI commands our scripts use. All tools of
+one slab share a Bench, so the MDO and GDM see what the MFG and GPP
+drive through a DUT with configurable poles, settling and network
+latency. Use it with --sim on the sweep scripts.
+"""
+import copy
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+from instruments import GDM_RATES, short_form
+from scaling import vertical_scale
+from waveform import COUNTS_PER_DIV
+
+# Bound at import so that patching time.sleep does not change the model
+_sleep = time.sleep
+
+DEFAULTS = {
+    # DC gain and poles in Hz, feedback > 0 closes the loop around them with that factor
+    "dut": {"gain": 100.0, "poles": [1e3, 1e5], "feedback": 0.0},
+    # Overrides of "dut" for the DUT on MFG port 2, e.g. {"gain": 10.0}
+    "dut2": {},
+    "latency": 0.002,  # Network round trip per command in seconds
+    "settle_time": 0.05,  # Time constant of the DUT output after a change
+    "autoscale_time": 0.5,
+    "gpp_settle_time": 0.2,  # Time constant of the supply output
+    "noise": 1e-3,  # RMS noise on the scope channels in volts
+    "gdm_noise": 1e-4,
+    "gpp_list": True,  # Whether the supply takes a setpoint list
+    "missing": [],  # Unreachable tools, e.g. ["5-gpp"]
+}
+
+_RESOURCE = re.compile(r"TCPIP::nano-slab-(\d+)-(\w+)\.uio\.no::(\d+)::SOCKET")
+_INDEX = re.compile(r"^(\D*?)(\d*)$")
+_VSET = re.compile(r"^VSET(\d):(.*)$", re.I)
+
+
+def load_config(path=None):
+    config = json.loads(json.dumps(DEFAULTS))
+    if path and path != "default":
+        with open(path) as f:
+            overrides = json.load(f)
+        config.update({k: v for k, v in overrides.items() if k not in ("dut", "dut2")})
+        config["dut"].update(overrides.get("dut", {}))
+        config["dut2"].update(overrides.get("dut2", {}))
+    return config
+
+
+def parse(command):
+    """Split a command into its short header, numeric suffixes and arguments."""
+    command = command.strip()
+    header, _, arguments = command.partition(' ')
+    is_query = header.endswith('?')
+    keys, indexes = [], []
+    for token in header.rstrip('?').lstrip(':').split(':'):
+        name, index = _INDEX.match(token).groups()
+        keys.append(short_form(name))
+        indexes.append(int(index) if index else None)
+    return ':'.join(keys), indexes, arguments.strip(), is_query
+
+
+# Keys as parse() produces them for the headers the scripts write in long form
+RECORD_LENGTH = parse(":ACQuire:RECOrdlength")[0]
+DETECTOR_RATE = parse(":DETector:RATE")[0]
+
+
+def parse_number(text):
+    text = text.strip().upper()
+    scale = 1
+    for suffix, factor in (("MHZ", 1e6), ("KHZ", 1e3), ("HZ", 1)):
+        if text.endswith(suffix):
+            text, scale = text[:-len(suffix)], factor
+            break
+    return float(text) * scale
+
+
+def number(value):
+    return f"{float(value):.6e}"
+
+
+def sine_fit(wt, *records):
+    """Complex amplitude c - js of each record fitted as c cos(wt) + s sin(wt) + dc.
+
+    Least squares, exact whatever the number of periods on screen.
+    """
+    basis = np.stack([np.cos(wt), np.sin(wt), np.ones_like(wt)], axis=1)
+    (c, s, _) = np.linalg.lstsq(basis, np.stack(records, axis=1), rcond=None)[0]
+    return c - 1j * s
+
+
+class Bench:
+    """Shared state of the tools on one slab."""
+
+    def __init__(self, lab_num, config):
+        self.lab_num = lab_num
+        self.config = config
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng(lab_num)
+        self.busy_until = 0.0
+        now = time.perf_counter()
+        self.mfg = {port: {"function": "SIN", "frequency": 1e3, "amplitude": 1.0, "offset": 0.0,
+                           "output": True, "sweep": False, "start": 1.0, "stop": 1e4,
+                           "spacing": "LIN", "sweep_time": 1.0, "sweep_start": now,
+                           "changed": now}
+                    for port in (1, 2)}
+        self.gpp = {port: {"set": 0.0, "from": 0.0, "changed": now, "output": False,
+                           "list": None, "dwell": 1.0, "list_start": None}
+                    for port in (1, 2)}
+        self.gpp_errors = []
+        self.gpp_last = 1
+        self.gdm = {"count": 1, "rate": "M", "triggered": now}
+        self.measure_source = {1: 1, 2: 2}
+        self.record_length = 10000
+        self.timebase = None
+        # Vertical scale and offset per channel, None until set or autoscaled
+        self.scales = {channel: None for channel in range(1, 5)}
+        self.offsets = {channel: 0.0 for channel in range(1, 5)}
+        self.frozen = None
+        self.frozen_mfg = None
+        # Hardware averaging divides the scope noise by the root of the count
+        self.acquire = {"mode": "SAMP", "average": 2}
+        # Edge trigger, the free running scope ignores it for anything but a square wave
+        self.trigger = {"source": None, "slope": "RIS"}
+
+    def generator(self, port):
+        # A stopped scope keeps showing the signal from before the stop
+        return (self.frozen_mfg or self.mfg)[port]
+
+    def response(self, frequency, port=1):
+        dut = self.config["dut"]
+        if port == 2:
+            dut = {**dut, **self.config["dut2"]}
+        s = 2j * np.pi * np.asarray(frequency, dtype=float)
+        h = dut["gain"] * np.ones_like(s)
+        for pole in dut["poles"]:
+            h = h / (1 + s / (2 * np.pi * pole))
+        feedback = dut.get("feedback", 0.0)
+        if feedback:
+            h = h / (1 + feedback * h)
+        return h
+
+    def square_response(self, port, t):
+        """DUT output for the square wave on port, from one period of it so that
+        any stretch of time, however short, comes out right."""
+        mfg = self.generator(port)
+        period = 1 / mfg["frequency"]
+        n = 1 << 16
+        tp = np.arange(n) * period / n
+        wave = np.where(tp < period / 2, 1.0, -1.0) * mfg["amplitude"] / 2
+        out = np.fft.irfft(np.fft.rfft(wave) * self.response(np.fft.rfftfreq(n, period / n), port), n)
+        return np.interp(np.mod(t, period), tp, out, period=period)
+
+    def frequency(self, port, t):
+        """Instantaneous MFG frequency and phase at times t."""
+        mfg = self.generator(port)
+        t = np.asarray(t, dtype=float)
+        if not mfg["sweep"]:
+            return np.full(t.shape, mfg["frequency"]), 2 * np.pi * mfg["frequency"] * t
+        T = mfg["sweep_time"]
+        tau = (t - mfg["sweep_start"]) % T
+        f0, f1 = mfg["start"], mfg["stop"]
+        if mfg["spacing"] == "LOG":
+            k = f1 / f0
+            frequency = f0 * k**(tau / T)
+            phase = 2 * np.pi * f0 * T / np.log(k) * (k**(tau / T) - 1)
+        else:
+            frequency = f0 + (f1 - f0) * tau / T
+            phase = 2 * np.pi * (f0 * tau + (f1 - f0) * tau**2 / (2 * T))
+        return frequency, phase
+
+    def channel(self, channel, t):
+        """Voltage on a scope channel: odd channels see MFG output (channel+1)//2,
+        even channels the DUT output driven by it."""
+        port = (channel + 1) // 2
+        mfg = self.generator(port)
+        if not mfg["output"]:
+            return np.zeros(np.shape(t))
+        frequency, phase = self.frequency(port, t)
+        amplitude = mfg["amplitude"] / 2
+        if mfg["function"].startswith("SQU"):
+            wave = amplitude * np.sign(np.sin(phase))
+        else:
+            wave = amplitude * np.sin(phase)
+        if channel % 2 == 1:
+            return wave + mfg["offset"]
+        if mfg["function"].startswith("SQU") and not mfg["sweep"]:
+            out = self.square_response(port, t)
+        elif mfg["function"].startswith("SQU"):
+            spectrum = np.fft.rfft(wave)
+            f = np.fft.rfftfreq(wave.size, np.mean(np.diff(t)) if np.size(t) > 1 else 1.0)
+            out = np.fft.irfft(spectrum * self.response(f, port), wave.size)
+        else:
+            h = self.response(frequency, port)
+            out = amplitude * np.abs(h) * np.sin(phase + np.angle(h))
+        settled = 1 - np.exp(-(np.asarray(t) - mfg["changed"]) / self.config["settle_time"])
+        return out * np.clip(settled, 0, 1)
+
+    def screen(self, channel, v):
+        """v as digitised, clipped a division beyond the edge of the screen."""
+        scale = self.scales[channel]
+        if scale is None:
+            return v
+        return np.clip(v, -5 * scale - self.offsets[channel], 5 * scale - self.offsets[channel])
+
+    def autoscale(self, now):
+        self.timebase = None
+        # The scales fit the signal as it is when the autoscale finishes
+        t, dt, when = self.record(now + self.config["autoscale_time"])
+        for channel in self.scales:
+            v = self.channel(channel, when + t)
+            self.scales[channel] = float(vertical_scale(max(np.ptp(v), 1e-3)))
+            self.offsets[channel] = -float(np.mean(v))
+
+    def scope_noise(self, size):
+        averaged = self.acquire["average"] if self.acquire["mode"] == "AVER" else 1
+        return self.rng.normal(0, self.config["noise"] / np.sqrt(averaged), size)
+
+    def dc_voltage(self, now):
+        gpp = self.gpp[self.gpp_last]
+        if not gpp["output"]:
+            return 0.0
+        target, start, changed = gpp["set"], gpp["from"], gpp["changed"]
+        if gpp["list_start"] is not None and now >= gpp["list_start"]:
+            # Stepping through the list, holding the last value at the end
+            values = gpp["list"]
+            i = min(int((now - gpp["list_start"]) / gpp["dwell"]), len(values) - 1)
+            target = values[i]
+            start = values[i - 1] if i else gpp["set"]
+            changed = gpp["list_start"] + i * gpp["dwell"]
+        alpha = np.exp(-(now - changed) / self.config["gpp_settle_time"])
+        return target + (start - target) * alpha
+
+    def record(self, now):
+        if self.frozen is not None:
+            now = self.frozen
+        if self.timebase is not None:
+            # Ten divisions on screen
+            dt = 10 * self.timebase / self.record_length
+        else:
+            # Ten periods of the input frequency, like after an autoscale
+            frequency, _ = self.frequency(1, now)
+            dt = 10 / (float(frequency) * self.record_length)
+        t = (np.arange(self.record_length) - self.record_length / 2) * dt
+        # The record ends at the time of the acquisition
+        when = now - t[-1]
+        if self.trigger["source"] is not None:
+            mfg = self.generator((self.trigger["source"] + 1) // 2)
+            if mfg["function"].startswith("SQU") and not mfg["sweep"]:
+                # Time zero on the last edge the record fits around, the square starts rising at t = 0
+                period = 1 / mfg["frequency"]
+                edge = 0.0 if self.trigger["slope"] == "RIS" else period / 2
+                when = np.floor((when - edge) / period) * period + edge
+        return t, dt, when
+
+
+class SimResource:
+    def __init__(self, bench, tool):
+        self.bench = bench
+        self.tool = tool
+        self.timeout = 2000
+        self.read_termination = None
+        self.write_termination = None
+        self._out = bytearray()
+
+    # pyvisa message based resource interface
+
+    def write(self, message):
+        config = self.bench.config
+        _sleep(config["latency"] / 2)
+        replies = []
+        self._wait = 0.0
+        with self.bench.lock:
+            for command in message.split(';'):
+                if command.strip():
+                    reply = self._handle(command)
+                    if reply is not None:
+                        replies.append(reply)
+        _sleep(self._wait)
+        if replies:
+            binary = [r for r in replies if isinstance(r, bytes)]
+            if binary:
+                self._out += binary[0] + b'\n'
+            else:
+                self._out += (';'.join(replies) + '\n').encode()
+        return len(message)
+
+    def read(self):
+        _sleep(self.bench.config["latency"] / 2)
+        end = self._out.find(b'\n')
+        if end < 0:
+            raise TimeoutError(f"{self.tool}: nothing to read")
+        reply = bytes(self._out[:end]).decode()
+        del self._out[:end + 1]
+        return reply
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        if not self._out:
+            raise TimeoutError(f"{self.tool}: nothing to read")
+        _sleep(self.bench.config["latency"] / 2)
+        data = bytes(self._out[:count])
+        del self._out[:count]
+        return data
+
+    def query(self, message):
+        self.write(message)
+        return self.read()
+
+    def close(self):
+        pass
+
+    # SCPI command handling
+
+    def _handle(self, command):
+        bench = self.bench
+        now = time.perf_counter()
+        vset = _VSET.match(command.strip())
+        if vset and self.tool == "gpp":
+            # The GPP takes VSET<n>:<value> without a space
+            self._vset(int(vset[1]), float(vset[2]), now)
+            return None
+        key, indexes, arguments, is_query = parse(command)
+        if key == "*IDN":
+            return f"Simulated,{self.tool.upper()},slab{bench.lab_num},1.0"
+        if key == "*OPC":
+            self._wait = max(self._wait, bench.busy_until - now)
+            return "1"
+        if key in ("*RST", "*CLS", "*TRG"):
+            if key == "*TRG" and self.tool == "mfg":
+                for mfg in bench.mfg.values():
+                    mfg["sweep_start"] = now
+            elif key == "*TRG" and self.tool == "gpp":
+                for gpp in bench.gpp.values():
+                    if gpp["list"] is not None:
+                        gpp["list_start"] = now
+            return None
+        handler = getattr(self, "_" + self.tool)
+        reply = handler(key, indexes, arguments, is_query, now)
+        if reply is None and is_query:
+            return "?"
+        return reply
+
+    def _mfg(self, key, indexes, arguments, is_query, now):
+        port = indexes[0] or 1
+        if port not in self.bench.mfg:
+            return None
+        mfg = self.bench.mfg[port]
+        value = arguments.upper()
+        if key == "OUTP":
+            if is_query:
+                return "ON" if mfg["output"] else "OFF"
+            mfg["output"] = value in ("ON", "1")
+        elif key == "OUTP:LOAD":
+            pass
+        elif key == "SOUR:APPL:SIN" or key == "SOUR:APPL:SQU":
+            parts = [p for p in arguments.split(',') if p.strip()]
+            mfg["function"] = key.rsplit(':', 1)[1]
+            for name, part in zip(("frequency", "amplitude", "offset"), parts):
+                mfg[name] = parse_number(part)
+            mfg["changed"] = now
+        elif key == "SOUR:FUNC":
+            if is_query:
+                return mfg["function"]
+            mfg["function"] = short_form(value)
+            mfg["changed"] = now
+        elif key in ("SOUR:FREQ", "SOUR:VOLT", "SOUR:VOLT:OFFS"):
+            name = {"SOUR:FREQ": "frequency", "SOUR:VOLT": "amplitude", "SOUR:VOLT:OFFS": "offset"}[key]
+            if is_query:
+                return number(mfg[name])
+            mfg[name] = parse_number(arguments)
+            mfg["changed"] = now
+        elif key in ("SOUR:FREQ:STAR", "SOUR:FREQ:STOP"):
+            name = "start" if key.endswith("STAR") else "stop"
+            if is_query:
+                return number(mfg[name])
+            mfg[name] = parse_number(arguments)
+        elif key == "SOUR:SWE:SPAC":
+            mfg["spacing"] = "LOG" if value.startswith("LOG") else "LIN"
+        elif key == "SOUR:SWE:TIM":
+            mfg["sweep_time"] = parse_number(arguments)
+        elif key in ("SOUR:SWE:STAT", "SOUR:FREQ:SWE:STAT"):
+            if is_query:
+                return "1" if mfg["sweep"] else "0"
+            mfg["sweep"] = value in ("ON", "1")
+            mfg["sweep_start"] = now
+            mfg["changed"] = now
+        elif key == "SOUR:MARK:FREQ" and is_query:
+            return number(self.bench.frequency(port, now)[0])
+        return None
+
+    def _mdo(self, key, indexes, arguments, is_query, now):
+        bench = self.bench
+        config = bench.config
+        if key in ("AUT", "AUTOS"):
+            bench.busy_until = now + config["autoscale_time"]
+            bench.autoscale(now)
+        elif key == "TIM:SCAL":
+            bench.timebase = None if arguments.upper() == "AUTO" else parse_number(arguments)
+        elif key == "CHAN:DISP":
+            if is_query:
+                return "ON"
+        elif key == "CHAN:SCAL":
+            if is_query:
+                return number(bench.scales[indexes[0] or 1] or 1.0)
+            bench.scales[indexes[0] or 1] = parse_number(arguments)
+        elif key == "CHAN:OFFS":
+            if is_query:
+                return number(bench.offsets[indexes[0] or 1])
+            bench.offsets[indexes[0] or 1] = parse_number(arguments)
+        elif key == "MEAS:SOUR":
+            if is_query:
+                return f"CH{bench.measure_source[indexes[1] or 1]}"
+            bench.measure_source[indexes[1] or 1] = int(_INDEX.match(arguments.upper())[2])
+        elif key in ("MEAS:AMPL", "MEAS:FREQ", "MEAS:PHAS"):
+            t, dt, when = bench.record(now)
+            if key == "MEAS:PHAS":
+                a = bench.channel(bench.measure_source[1], when + t) + bench.scope_noise(t.size)
+                b = bench.channel(bench.measure_source[2], when + t) + bench.scope_noise(t.size)
+                frequency, _ = bench.frequency(1, when)
+                wt = 2 * np.pi * float(frequency) * (when + t)
+                fit_a, fit_b = sine_fit(wt, a, b)
+                return number(np.degrees(np.angle(fit_b / fit_a)))
+            channel = bench.measure_source[1]
+            if key == "MEAS:FREQ":
+                frequency, _ = bench.frequency((channel + 1) // 2, when)
+                return number(frequency)
+            v = bench.screen(channel, bench.channel(channel, when + t) + bench.scope_noise(t.size))
+            port = (channel + 1) // 2
+            mfg = bench.generator(port)
+            if mfg["function"].startswith("SQU") or mfg["sweep"]:
+                return number(np.ptp(v))
+            # The peak to peak of a noisy record reads high by the noise and
+            # the sine fitted to it does not, capped at what fits on screen
+            fit, = sine_fit(2 * np.pi * mfg["frequency"] * (when + t), v)
+            return number(min(2 * abs(fit), np.ptp(v)))
+        elif key == "TRIG:SOUR":
+            if is_query:
+                return f"CH{bench.trigger['source']}" if bench.trigger["source"] else "EXT"
+            source = _INDEX.match(arguments.upper())
+            bench.trigger["source"] = int(source[2]) if arguments.upper().startswith("CH") and source[2] else None
+        elif key == "TRIG:EDG:SLOP":
+            bench.trigger["slope"] = "FALL" if arguments.upper().startswith("FALL") else "RIS"
+        elif key == "TRIG:LEV":
+            pass
+        elif key == "ACQ:MOD":
+            if is_query:
+                return bench.acquire["mode"]
+            bench.acquire["mode"] = short_form(arguments)
+        elif key == "ACQ:AVER":
+            if is_query:
+                return str(bench.acquire["average"])
+            bench.acquire["average"] = int(float(arguments))
+        elif key == RECORD_LENGTH:
+            if is_query:
+                return str(bench.record_length)
+            bench.record_length = int(parse_number(arguments))
+        elif key == "STOP":
+            bench.frozen = now
+            bench.frozen_mfg = copy.deepcopy(bench.mfg)
+        elif key == "RUN":
+            bench.frozen = None
+            bench.frozen_mfg = None
+        elif key == "ACQ:MEM" and is_query:
+            return self._memory(indexes[0] or 1, now)
+        return None
+
+    def _memory(self, channel, now):
+        bench = self.bench
+        t, dt, when = bench.record(now)
+        v = bench.channel(channel, when + t) + bench.scope_noise(t.size)
+        v = bench.screen(channel, v)
+        # Pick a scale that keeps the trace within +-4 divisions
+        scale = max(float(np.max(np.abs(v))) / 4, 1e-3)
+        counts = np.clip(np.round(v / scale * COUNTS_PER_DIV), -32768, 32767).astype('>i2')
+        preamble = (f"Format,2.0E;Memory Length,{t.size};Source,CH{channel};Vertical Units,V;"
+                    f"Vertical Scale,{scale:.6e};Horizontal Units,S;Horizontal Position,0;"
+                    f"Sampling Period,{dt:.6e};Waveform Data;")
+        data = counts.tobytes()
+        return preamble.encode() + f"#{len(str(len(data)))}{len(data)}".encode() + data
+
+    def _gdm(self, key, indexes, arguments, is_query, now):
+        bench = self.bench
+        gdm = bench.gdm
+        if key == "MEAS:VOLT:DC" and is_query:
+            return number(bench.dc_voltage(now) + bench.rng.normal(0, bench.config["gdm_noise"]))
+        elif key == "SAMP:COUN":
+            gdm["count"] = int(float(arguments))
+        elif key == DETECTOR_RATE:
+            gdm["rate"] = arguments.strip().upper()[0]
+        elif key == "INIT":
+            gdm["triggered"] = now
+        elif key == "FETC" and is_query:
+            # The readings are taken one after the other at the detector rate
+            t = gdm["triggered"] + np.arange(gdm["count"]) / GDM_RATES[gdm["rate"]]
+            self._wait = max(self._wait, t[-1] - now)
+            v = [bench.dc_voltage(when) for when in t] + bench.rng.normal(0, bench.config["gdm_noise"], t.size)
+            return ",".join(number(x) for x in v)
+        return None
+
+    def _vset(self, port, voltage, now):
+        bench = self.bench
+        gpp = bench.gpp[port]
+        gpp["from"] = bench.dc_voltage(now) if bench.gpp_last == port else gpp["set"]
+        gpp["set"] = voltage
+        gpp["changed"] = now
+        # Setting the voltage by hand ends a running list
+        gpp["list"] = gpp["list_start"] = None
+        bench.gpp_last = port
+
+    def _gpp(self, key, indexes, arguments, is_query, now):
+        bench = self.bench
+        if key == "SOUR:VOLT" and is_query:
+            return number(bench.gpp[indexes[0] or 1]["set"])
+        elif key == "OUTP:STAT":
+            port = indexes[0] or 1
+            bench.gpp[port]["output"] = arguments.upper() in ("ON", "1")
+            bench.gpp[port]["changed"] = now
+            bench.gpp_last = port
+        elif key == "SYST:ERR" and is_query:
+            return bench.gpp_errors.pop(0) if bench.gpp_errors else '0,"No error"'
+        elif key.startswith("LIST"):
+            if not bench.config["gpp_list"]:
+                bench.gpp_errors.append('-113,"Undefined header"')
+                return None
+            gpp = bench.gpp[indexes[0] or 1]
+            if key == "LIST:VOLT":
+                gpp["list"] = [float(v) for v in arguments.split(',')]
+                gpp["list_start"] = None
+            elif key == "LIST:DWEL":
+                gpp["dwell"] = float(arguments)
+            elif key == "LIST:STAT" and arguments.upper() in ("OFF", "0"):
+                gpp["list"] = gpp["list_start"] = None
+            bench.gpp_last = indexes[0] or 1
+        return None
+
+
+class SimResourceManager:
+    """Drop in for pyvisa.ResourceManager backed by simulated benches."""
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else load_config()
+        self.benches = {}
+
+    def open_resource(self, name, **kwargs):
+        lab_num, tool, _ = _RESOURCE.match(name).groups()
+        lab_num = int(lab_num)
+        if f"{lab_num}-{tool}" in self.config["missing"]:
+            raise ConnectionError(f"{name} is not reachable")
+        _sleep(self.config["latency"])
+        if lab_num not in self.benches:
+            self.benches[lab_num] = Bench(lab_num, self.config)
+        return SimResource(self.benches[lab_num], tool)
+
+    def list_resources(self):
+        return ()
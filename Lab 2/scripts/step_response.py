@@ -0,0 +1,94 @@
+"""Stability estimate from one edge of the closed loop step response.
+
+The MFG drives a square wave into the closed loop, the MDO triggers on its
+rising edge and captures the output around it at full record length.
+Overshoot, ringing and settling of that one edge give the damping and,
+taking the closed loop as second order, the phase margin. It takes a few
+seconds per board or bias point, a Bode sweep with read_waveform_mdo.py
+remains the reference.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from instruments import Session
+from analysis import step_metrics
+from scaling import vertical_scale
+from scpi_batch import Batch
+from settling import wait_opc
+from waveform import capture
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Estimate the phase margin from the step response to a square wave")
+    parser.add_argument('--slab_num', type=int, required=True, help='Lab number')
+    parser.add_argument('--mfg_output_port', type=int, required=True, help='MFG output port')
+    parser.add_argument('--mdo_input_port_in', type=int, required=True, help='MDO input channel for opamp input')
+    parser.add_argument('--mdo_input_port_out', type=int, required=True, help='MDO input channel for opamp output')
+    parser.add_argument('--frequency', type=float, default=1000, help='Square wave frequency, half a period has to be longer than the settling time')
+    parser.add_argument('--amplitude', type=float, default=0.1, help='Step size, small enough to keep the loop linear')
+    parser.add_argument('--offset', type=float, default=0, help='Signal offset')
+    parser.add_argument('--gain', type=float, default=1, help='Expected closed loop gain, for the output channel scale')
+    parser.add_argument('--record_length', type=int, default=10000, help='Record length of the capture')
+    parser.add_argument('--band', type=float, default=0.02, help='Settling band as a fraction of the step')
+    parser.add_argument('--settle', type=float, default=0.5, help='Seconds to wait after applying the square wave')
+    parser.add_argument('--save', help='Save the captured edge to this .npz file')
+    parser.add_argument('--plot', action='store_true', help='Plot the captured edge')
+    parser.add_argument('--sim', nargs='?', const='default', help='Use the simulated bench, optionally configured by a JSON file')
+    return parser
+
+
+def configure(mfg, osc, args):
+    mfg.load_inf(args.mfg_output_port)
+    mfg.apply_square(args.mfg_output_port, args.frequency, args.amplitude, args.offset)
+    osc.trigger_edge(args.mdo_input_port_in, args.offset)
+    # The trigger sits mid screen, so the five divisions after it hold half a period
+    with Batch(osc) as batch:
+        for channel, gain in ((args.mdo_input_port_in, 1), (args.mdo_input_port_out, args.gain)):
+            batch.write(f':CHANnel{channel}:DISPlay ON')
+            # Room for 50 % overshoot
+            batch.write(f':CHANnel{channel}:SCALe {vertical_scale(1.5 * args.amplitude * abs(gain)):g}')
+            batch.write(f':CHANnel{channel}:OFFSet {-args.offset * gain:g}')
+        batch.write(f':TIMebase:SCALe {1 / (10 * args.frequency):g}')
+    wait_opc(osc)
+
+
+def measure_step(mfg, osc, args):
+    """Waveforms of the input and output around a rising edge and the metrics of the output."""
+    configure(mfg, osc, args)
+    time.sleep(args.settle)
+    wave_in, wave_out = capture(osc, (args.mdo_input_port_in, args.mdo_input_port_out), args.record_length)
+    return wave_in, wave_out, step_metrics(wave_out.time, wave_out.volts, args.band)
+
+
+def main(args):
+    session = Session(args.slab_num, sim=args.sim, timeout=20000)
+    wave_in, wave_out, metrics = measure_step(session.mfg, session.mdo, args)
+
+    print(f'Overshoot: {100 * metrics.overshoot:.1f} %')
+    if np.isnan(metrics.ringing_frequency):
+        print('Ringing frequency: no ringing')
+    else:
+        print(f'Ringing frequency: {metrics.ringing_frequency:.4g} Hz')
+    print(f'Settling time ({100 * args.band:g} %): {metrics.settling_time:.4g} s')
+    print(f'Damping ratio: {metrics.damping:.3f}')
+    bound = '>= ' if metrics.damping >= 1 else ''
+    print(f'Implied phase margin: {bound}{metrics.phase_margin:.1f} degrees')
+
+    if args.save:
+        np.savez(args.save, time=wave_out.time, v_in=wave_in.volts, v_out=wave_out.volts)
+    if args.plot:
+        import matplotlib.pyplot as plt
+        plt.plot(wave_in.time, wave_in.volts, label='Input')
+        plt.plot(wave_out.time, wave_out.volts, label='Output')
+        plt.xlabel('Time [s]')
+        plt.ylabel('Voltage [V]')
+        plt.title(f'Step response, phase margin {metrics.phase_margin:.1f} degrees')
+        plt.legend()
+        plt.grid(True)
+        plt.show()
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -1,18 +1,10 @@
-import pyvisa
 import numpy as np
-import time
 import argparse
 import matplotlib.pyplot as plt
 
-def exisiting_tool(lab_num,tool,socket_num):
-    fung = rm.open_resource("TCPIP::nano-slab-"+str(lab_num)+"-"+tool+".uio.no::"+str(socket_num)+"::SOCKET")
-    fung.read_termination = '\n'
-    if(tool == "gpp"):
-        pass 
-    else:
-        fung.write_termination = '\n'
-    print(fung.query('*IDN?'))
-    return fung
+from instruments import Session
+from settling import wait_opc, wait_settled
+from scaling import ScaleController
 
 if (__name__=="__main__"):
     #Parser for the input arguments
@@ -26,15 +18,14 @@ if (__name__=="__main__"):
     parser.add_argument("--steps", required=True, type=int, help="Number of steps in the frequency sweep")
     parser.add_argument("--amplitude", required=True, type=float, help="Amplitude of the signal")
     parser.add_argument("--offset", required=True, type=float, help="Offset of the signal")
+    parser.add_argument("--sim", nargs="?", const="default", help="Use the simulated bench, optionally configured by a JSON file")
 
     args = parser.parse_args()
 
-    #Invoking the resources
-    rm = pyvisa.ResourceManager()
-    rm.list_resources()
-
-    mfg = exisiting_tool(args.slab_num,"mfg",1026)
-    osc = exisiting_tool(args.slab_num,"mdo",3000)
+    session = Session(args.slab_num, sim=args.sim)
+    mfg = session.mfg
+    osc = session.mdo
+    scaler = ScaleController(osc, args.mdo_input_port_in, args.mdo_input_port_out, args.amplitude, args.offset)
 
     #Setting up the MFG
     #Set otuput load of MFG to high impedance
@@ -56,34 +47,40 @@ if (__name__=="__main__"):
         mfg.write('source'+str(args.mfg_output_port)+':appl:sin '+str(x)+','+str(args.amplitude)+','+str(args.offset))
         print('Cnt: '+str(i))
         #Wait for valid output from the mfg:
-        time.sleep(1)
+        wait_opc(mfg)
+
+        #Scale the scope for the new frequency instead of autoscaling
+        scaler.set(x)
+
+        #Without an autoscale in between the output may still be settling, wait until its amplitude stops moving
+        osc.write(':measure:source1 CH'+str(args.mdo_input_port_out))
+        wait_settled(lambda: float(osc.query(':measure:amplitude?')), rel_tol=0.01)
 
-        #Wait for autoscale to finish
-        osc.write(':AUTORSET?')
-        time.sleep(10)
+        for attempt in range(3):
+            #Input measurement
+            osc.write(':CHANnel'+str(args.mdo_input_port_in)+':DISPlay ON')
+            osc.write(':measure:source1 CH'+str(args.mdo_input_port_in))
+            in_freq_values[i] = osc.query(':measure:frequency?')
+            in_amp_values[i] = osc.query(':measure:amplitude?')
 
-        #Input measurement
-        osc.write(':CHANnel'+str(args.mdo_input_port_in)+':DISPlay ON')
-        osc.write(':measure:source1 CH'+str(args.mdo_input_port_in))
-        in_freq_values[i] = osc.write(':measure:frequency?')
-        in_amp_values[i] = osc.write(':measure:amplitude?')
-        time.sleep(0.5)
+            #Output measurement, the single source measurements use source1
+            osc.write(':CHANnel'+str(args.mdo_input_port_out)+':DISPlay ON')
+            osc.write(':measure:source1 CH'+str(args.mdo_input_port_out))
+            out_freq_values[i] = osc.query(':measure:frequency?')
+            out_amp_values[i] = osc.query(':measure:amplitude?')
 
-        #Output measurement
-        osc.write(':CHANnel'+str(args.mdo_input_port_out)+':DISPlay ON')
-        osc.write(':measure:source2 CH'+str(args.mdo_input_port_out))
-        out_freq_values[i] = osc.write(':measure:frequency?')
-        out_amp_values[i] = osc.write(':measure:amplitude?')
-        time.sleep(0.5)
+            #Phase difference measurement:
+            osc.write(':CHANnel'+str(args.mdo_input_port_in)+':DISPlay ON')
+            osc.write(':CHANnel'+str(args.mdo_input_port_out)+':DISPlay ON')
+            osc.write(':measure:source1 CH'+str(args.mdo_input_port_in)) #eg CH1
+            osc.write(':measure:source2 CH'+str(args.mdo_input_port_out)) #eg CH2
+            wait_opc(osc)
+            phase_shift[i] = osc.query('measure:phase?')
 
-        #Phase difference measurement:
-        osc.write(':CHANnel'+str(args.mdo_input_port_in)+':DISPlay ON')
-        osc.write(':CHANnel'+str(args.mdo_input_port_out)+':DISPlay ON')
-        osc.write(':measure:source1 CH'+str(args.mdo_input_port_in)) #eg CH1
-        osc.write(':measure:source2 CH'+str(args.mdo_input_port_out)) #eg CH2
-        phase_shift[i] = osc.write('measure:phase?')
+            #Measure again if a channel came back clipped or under-ranged
+            if scaler.check(x, in_amp_values[i], out_amp_values[i]):
+                break
         print('Phase difference: '+str(phase_shift[i]))
-        time.sleep(0.5)
         i = i + 1
     
     print(phase_shift)
\ No newline at end of file
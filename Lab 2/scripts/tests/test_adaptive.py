@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from adaptive import adaptive_sweep, margins
+from read_waveform_mdo import stability
+
+
+def test_stability_unwraps_the_phase_before_the_crossing():
+    frequencies = np.array([1e3, 1e4, 1e5, 1e6])
+    gain = np.array([40.0, 20.0, 10.0, -10.0])
+    # -170, -190 and -200 degrees as a local fit reports them
+    phase = np.array([-90.0, -170.0, 170.0, 160.0])
+    unity_gain_freq, phase_margin = stability(frequencies, gain, phase)
+    assert unity_gain_freq == pytest.approx(10**5.5)
+    assert phase_margin == pytest.approx(-15.0)
+
+
+@pytest.mark.parametrize("dc_gain", [300.0, 3000.0])
+def test_adaptive_sweep_converges_on_the_margins(dc_gain):
+    # Three poles, the phase margin is negative at the higher gain and the
+    # phase near the unity gain frequency comes back wrapped into +-180
+    def loop(freq):
+        return dc_gain / ((1 + 1j * freq / 1e2) * (1 + 1j * freq / 1e4) * (1 + 1j * freq / 1e5))
+
+    def measure(freq):
+        return 1.0, abs(loop(freq)), np.degrees(np.angle(loop(freq)))
+
+    frequencies, vpp_in, vpp_out, phase = adaptive_sweep(measure, 10, 1e7, max_points=50)
+    unity_gain_freq, phase_margin = margins(frequencies, 20 * np.log10(vpp_out / vpp_in), phase)
+
+    dense = np.logspace(3, 6, 300001)
+    exact_freq = dense[np.argmin(np.abs(np.abs(loop(dense)) - 1))]
+    exact_margin = 180 - np.degrees(sum(np.arctan(exact_freq / pole) for pole in (1e2, 1e4, 1e5)))
+    assert len(frequencies) < 50
+    assert unity_gain_freq == pytest.approx(exact_freq, rel=0.01)
+    assert phase_margin == pytest.approx(exact_margin, abs=1.0)
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from averaging import collect, t_quantile
+
+# Two sided Student t quantiles from the usual tables
+TABLE = [
+    (0.95, 1, 12.706), (0.99, 1, 63.657),
+    (0.95, 2, 4.303), (0.99, 2, 9.925),
+    (0.95, 3, 3.182), (0.99, 4, 4.604),
+    (0.95, 5, 2.571), (0.90, 9, 1.833),
+    (0.99, 10, 3.169), (0.95, 30, 2.042),
+    (0.95, 120, 1.980),
+]
+
+
+@pytest.mark.parametrize("confidence, dof, quantile", TABLE)
+def test_t_quantile_matches_the_tables(confidence, dof, quantile):
+    assert t_quantile(confidence, dof) == pytest.approx(quantile, abs=1e-3)
+
+
+def test_collect_stops_once_the_target_is_met():
+    rng = np.random.default_rng(1)
+    result = collect(lambda: rng.normal(1.0, 0.1), (0.02,), max_count=1000)
+    assert result.ci[0] <= 0.02
+    assert abs(result.mean[0] - 1.0) < 0.05
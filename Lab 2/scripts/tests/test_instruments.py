@@ -0,0 +1,31 @@
+import time
+
+from instruments import Session, inventory_key, setting, short_form
+
+
+def test_short_form_takes_the_upper_case_letters():
+    assert short_form("RECOrdlength") == "RECO"
+    assert short_form("CHANnel") == "CHAN"
+    # A keyword in a single case falls back to four characters, three before a vowel
+    assert short_form("measure") == "MEAS"
+    assert short_form("TIMEBASE") == "TIM"
+
+
+def test_missing_suffix_is_suffix_one():
+    assert setting(":MEASure:SOURce CH2")[0] == setting(":MEAS:SOUR1 CH1")[0]
+    assert setting(":MEASure:SOURce2 CH2")[0] != setting(":MEAS:SOUR1 CH1")[0]
+
+
+def inventory(age):
+    return {inventory_key(1, "mdo"): {"lab_num": 1, "tool": "mdo", "idn": "Cached,MDO", "reachable": True,
+                                      "time": time.time() - age}}
+
+
+def test_recent_inventory_entry_is_trusted():
+    session = Session(1, sim="default", verbose=False, inventory=inventory(60))
+    assert session.mdo.idn == "Cached,MDO"
+
+
+def test_old_inventory_entry_is_identified_again():
+    session = Session(1, sim="default", verbose=False, inventory=inventory(24 * 3600))
+    assert session.mdo.idn.startswith("Simulated,MDO")
@@ -0,0 +1,10 @@
+from live_plot import LivePlot
+
+
+def test_add_drops_what_is_not_a_number(tmp_path):
+    live = LivePlot("bode", show=False, snapshots=[str(tmp_path / "bode.png")])
+    live.add(100, -3.0, "?")
+    live.add(1000, -6.0, -45.0)
+    live.close()
+    assert live.dropped == 1
+    assert (tmp_path / "bode.png").exists()
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import results
+from results import ResultFile
+
+
+def test_resume_skips_recorded_points(tmp_path):
+    path = tmp_path / "sweep.jsonl"
+    with ResultFile(path, ("freq", "gain")) as f:
+        f.append(100.0, (1.5,))
+        f.append(np.float64(200.0), (np.float64(2.5),))
+
+    measured = []
+    with ResultFile(path, ("freq", "gain"), resume=True) as f:
+        for setpoint in (100.0, 200.0, 300.0):
+            f.point(setpoint, lambda: measured.append(setpoint) or (3.5,))
+
+    assert measured == [300.0]
+    headers, data = results.load(path)
+    assert [h["type"] for h in headers] == ["header", "resume"]
+    assert list(data["freq"]) == [100.0, 200.0, 300.0]
+    assert list(data["gain"]) == [1.5, 2.5, 3.5]
+
+
+def test_existing_file_needs_resume(tmp_path):
+    path = tmp_path / "sweep.jsonl"
+    ResultFile(path, ("freq", "gain")).close()
+    with pytest.raises(FileExistsError):
+        ResultFile(path, ("freq", "gain"))
+    with pytest.raises(ValueError):
+        ResultFile(path, ("voltage", "current"), resume=True)
+
+
+def test_truncated_line_is_skipped_and_terminated(tmp_path):
+    path = tmp_path / "sweep.jsonl"
+    with ResultFile(path, ("freq", "gain")) as f:
+        f.append(100.0, (1.5,))
+    # A crash in the middle of writing the next point
+    with open(path, "a") as f:
+        f.write('{"type": "point", "values": [200')
+
+    with ResultFile(path, ("freq", "gain"), resume=True) as f:
+        assert 100.0 in f
+        assert 200.0 not in f
+        f.append(200.0, (2.5,))
+
+    headers, rows = results.read(path)
+    assert rows == [[100.0, 1.5], [200.0, 2.5]]
+    assert len(headers) == 2
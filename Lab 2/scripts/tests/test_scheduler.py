@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import Step, run_steps
+
+
+def test_steps_keep_tool_order_and_overlap_across_tools():
+    log = []
+    other_started = threading.Event()
+
+    def first():
+        # Only returns early when the step on the other tool runs alongside
+        overlapped = other_started.wait(timeout=5)
+        log.append("first")
+        return overlapped
+
+    def other():
+        other_started.set()
+        log.append("other")
+        return "other"
+
+    results = run_steps([
+        Step("first", first, tools=("mfg",)),
+        Step("second", lambda: log.append("second") or "second", tools=("mfg",)),
+        Step("other", other, tools=("mdo",)),
+        Step("last", lambda: log.append("last") or "last", after=("second", "other")),
+    ])
+
+    assert results == {"first": True, "second": "second", "other": "other", "last": "last"}
+    assert log.index("first") < log.index("second") < log.index("last")
+    assert log.index("other") < log.index("last")
+
+
+def test_error_waits_for_running_steps_and_drops_the_rest():
+    log = []
+
+    def fail():
+        raise RuntimeError("tool timed out")
+
+    def slow():
+        time.sleep(0.1)
+        log.append("slow")
+
+    with pytest.raises(RuntimeError, match="tool timed out"):
+        run_steps([
+            Step("fail", fail, tools=("mfg",)),
+            Step("slow", slow, tools=("mdo",)),
+            Step("next", lambda: log.append("next"), tools=("mfg",)),
+        ])
+    assert log == ["slow"]
+
+
+def test_unknown_or_circular_dependencies_are_refused():
+    with pytest.raises(ValueError, match="unknown"):
+        run_steps([Step("a", lambda: None, after=("b",))])
+    with pytest.raises(ValueError, match="never start"):
+        run_steps([Step("a", lambda: None, after=("b",)), Step("b", lambda: None, after=("a",))])
@@ -0,0 +1,22 @@
+from instruments import Session
+from waveform import capture
+
+
+def test_record_length_sets_the_number_of_points():
+    # 25000 used to go out as 2e+04
+    session = Session(1, sim="default")
+    for record_length in (1000, 5000, 25000):
+        waves = capture(session.mdo, (1, 2), record_length)
+        assert [wave.volts.size for wave in waves] == [record_length, record_length]
+
+
+def test_amplitude_is_not_raised_by_noise():
+    # The peak to peak of the noisy record read the 10 mV input 4 dB high
+    session = Session(1, sim="default")
+    session.mfg.write('OUTPUT1:LOAD INF')
+    session.mfg.write('SOURCE1:APPL:SIN 1000,0.01,0')
+    session.mfg.write('OUTPUT1 ON')
+    session.mdo.write(':CHANnel1:SCALe 0.002')
+    session.mdo.write(':TIMebase:SCALe 0.001')
+    session.mdo.write(':MEASure:SOURce1 CH1')
+    assert abs(float(session.mdo.query(':MEASure:AMPLitude?')) - 0.01) < 0.0005
@@ -0,0 +1,13 @@
+import time
+
+from tracing import Tracer
+
+
+def test_sleeps_are_recorded_and_restored():
+    real_sleep = time.sleep
+    tracer = Tracer()
+    with tracer.sleeps():
+        time.sleep(0.01)
+    assert time.sleep is real_sleep
+    assert tracer.count("sleep") == 1
+    assert tracer.total("sleep") >= 0.01
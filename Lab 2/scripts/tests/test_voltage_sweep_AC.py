@@ -0,0 +1,22 @@
+import numpy as np
+
+import voltage_sweep_AC
+from instruments import Session
+
+
+def test_hardware_sweep_measures_the_phase_of_every_point():
+    # :MEASure:SOURce and :MEASure:SOURce1 are the same setting, the shadow
+    # used to drop the write that moves it back to the input channel
+    args = voltage_sweep_AC.build_parser().parse_args([
+        "--slab_num", "1", "--mfg_output_port", "1", "--mdo_input_port_in", "1", "--mdo_input_port_out", "2",
+        "--start_frequency", "100", "--stop_frequency", "10000", "--sweep_time", "1",
+        "--amplitude", "0.1", "--offset", "0", "--sim",
+    ])
+    session = Session(args.slab_num, sim=args.sim)
+    frequencies, _, _, _, phase_shift = voltage_sweep_AC.hardware_sweep(session.mfg, session.mdo, args)
+    frequencies = np.array(frequencies, dtype=float)
+    phase_shift = np.array(phase_shift, dtype=float)
+    # The default simulated DUT has poles at 1 kHz and 100 kHz
+    expected = -np.degrees(np.arctan(frequencies / 1e3) + np.arctan(frequencies / 1e5))
+    assert len(phase_shift) > 5
+    assert np.all(np.abs(phase_shift - expected) < 5)
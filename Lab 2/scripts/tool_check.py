@@ -1,35 +1,21 @@
-import pyvisa
 import argparse
 
-#Checking of tool is available
-def exisiting_tool(lab_num,tool,soccet_num):
-    fung = rm.open_resource("TCPIP::nano-slab-"+str(lab_num)+"-"+tool+".uio.no::"+str(soccet_num)+"::SOCKET")
-    fung.read_termination = '\n'
-    if(tool == "gpp"):
-        pass 
-    else:
-        fung.write_termination = '\n'
-    print(fung.query('*IDN?'))
-    return fung
+from instruments import Session
 
-if (__name__ == "__main__"):
+
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Setting a DC voltage with the power supply (gpp) and reading it with the digital multimeter(gdm)"
     )
     parser.add_argument("--slab_num", required=True, type=int, help="Lab space number between 1 and 6")
     parser.add_argument("--tool", required=True, type=str, help="Tools: gpp, gdm, mdo, mfg")
-    args = parser.parse_args()
+    parser.add_argument("--sim", nargs="?", const="default", help="Use the simulated bench, optionally configured by a JSON file")
+    return parser
+
 
-    #Invoking the resources
-    rm = pyvisa.ResourceManager()
-    rm.list_resources()
-	
-    if(args.tool == "mdo"):
-        socket_num = 3000
-    elif(args.tool == "gdm"):
-        socket_num = 3001
-    else:
-        socket_num = 1026
-	
-    
-    exisiting_tool(args.slab_num,args.tool,socket_num) 
\ No newline at end of file
+def main(args):
+    Session(args.slab_num, sim=args.sim, inventory={}).get(args.tool)
+
+
+if (__name__ == "__main__"):
+    main(build_parser().parse_args())
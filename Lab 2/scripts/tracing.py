@@ -0,0 +1,158 @@
+"""Opt-in tracing of the instrument I/O and sleeps of a run.
+
+Every write, read and query of a traced tool becomes a span with the
+command, the tool, the bytes each way, the start time and the duration.
+Sleeps inside Tracer.sleeps() become spans too. report() prints latency
+statistics and a log-binned histogram per command, save() writes a Chrome
+trace (chrome://tracing or ui.perfetto.dev) with one row per tool.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from instruments import setting, short_header
+
+# Trace rows of the tools, sleeps get one row per thread after these
+ROWS = {"mfg": 1, "mdo": 2, "gdm": 3, "gpp": 4}
+
+# Histogram bins from 100 us to 100 s, three per decade
+BINS = 10.0**np.arange(-4, 2.01, 1 / 3)
+
+
+def command_name(message):
+    """Short headers of the commands in a message, without their arguments, so
+    that the same command groups together whatever it was set to."""
+    names = []
+    for part in filter(str.strip, message.split(';')):
+        header = part.strip().partition(' ')[0]
+        key_value = setting(part)
+        if key_value and header == part.strip():
+            # VSET1:2.5 has its value in the header
+            names.append(key_value[0])
+        else:
+            names.append(short_header(header.rstrip('?')) + '?' * header.endswith('?'))
+    return ';'.join(names)
+
+
+class TracedResource:
+    """Forwards to a pyvisa resource and records a span per I/O call."""
+
+    def __init__(self, resource, tracer, tool, lab_num):
+        object.__setattr__(self, "_resource", resource)
+        object.__setattr__(self, "_tracer", tracer)
+        object.__setattr__(self, "_tool", tool)
+        object.__setattr__(self, "_lab_num", lab_num)
+
+    def __getattr__(self, name):
+        attr = getattr(self._resource, name)
+        if name not in ("write", "read", "query", "read_bytes"):
+            return attr
+
+        def traced(*args, **kwargs):
+            start = time.perf_counter()
+            reply = None
+            try:
+                reply = attr(*args, **kwargs)
+                return reply
+            finally:
+                message = args[0] if name in ("write", "query") else ""
+                self._tracer.add(
+                    command_name(message) if message else name, "io", start, time.perf_counter() - start,
+                    tool=self._tool, lab_num=self._lab_num, call=name, message=message,
+                    sent=len(message), received=len(reply) if name != "write" and reply is not None else 0,
+                )
+        return traced
+
+    def __setattr__(self, name, value):
+        setattr(self._resource, name, value)
+
+
+class Tracer:
+    """Spans of a run, tools are traced from attach() on."""
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+
+    def add(self, name, category, start, duration, **details):
+        self.events.append({"name": name, "category": category, "start": start, "duration": duration,
+                            "thread": threading.get_ident(), **details})
+
+    def attach(self, tool):
+        """Trace the I/O of a Tool (instruments.Tool)."""
+        tool.resource = TracedResource(tool.resource, self, tool.name, tool.lab_num)
+
+    @contextmanager
+    def sleeps(self):
+        """Record every time.sleep() made inside the block."""
+        real_sleep = time.sleep
+
+        def traced_sleep(seconds):
+            start = time.perf_counter()
+            real_sleep(seconds)
+            self.add("sleep", "sleep", start, time.perf_counter() - start, requested=seconds)
+
+        # Modules look time.sleep up when they call it, so this covers all of them
+        time.sleep = traced_sleep
+        try:
+            yield self
+        finally:
+            time.sleep = real_sleep
+
+    def total(self, category):
+        return sum(e["duration"] for e in self.events if e["category"] == category)
+
+    def count(self, category):
+        return sum(1 for e in self.events if e["category"] == category)
+
+    def durations(self):
+        """Durations in seconds of every I/O command, by command name."""
+        grouped = {}
+        for e in self.events:
+            if e["category"] == "io":
+                grouped.setdefault(e["name"], []).append(e["duration"])
+        return {name: np.array(values) for name, values in grouped.items()}
+
+    def histograms(self):
+        """Counts per BINS interval of every command's latency."""
+        return {name: np.histogram(d, BINS)[0] for name, d in self.durations().items()}
+
+    def report(self, top=15):
+        """Print the commands that took the most time in total."""
+        durations = sorted(self.durations().items(), key=lambda item: -item[1].sum())
+        print(f"I/O {self.total('io'):.2f} s in {self.count('io')} calls, sleep {self.total('sleep'):.2f} s")
+        print(f"{'total s':>8} {'count':>6} {'mean ms':>8} {'p50 ms':>7} {'p90 ms':>7} {'max ms':>7}  histogram 0.1 ms..100 s  command")
+        for name, d in durations[:top]:
+            counts = np.histogram(d, BINS)[0]
+            bars = ''.join(" .:-=+*#%@"[min(9, int(np.ceil(9 * c / counts.max())))] for c in counts)
+            p50, p90 = np.percentile(d, [50, 90]) * 1e3
+            print(f"{d.sum():8.3f} {d.size:6d} {d.mean() * 1e3:8.2f} {p50:7.2f} {p90:7.2f} {d.max() * 1e3:7.2f}  {bars}  {name[:60]}")
+
+    def chrome_trace(self):
+        threads = {}
+        events = []
+        for e in self.events:
+            if e["category"] == "io":
+                pid, tid = e["lab_num"], ROWS.get(e["tool"], 0)
+            else:
+                pid, tid = 0, len(ROWS) + 1 + threads.setdefault(e["thread"], len(threads))
+            args = {k: v for k, v in e.items() if k not in ("name", "category", "start", "duration", "thread")}
+            events.append({"name": e["name"], "cat": e["category"], "ph": "X", "pid": pid, "tid": tid,
+                           "ts": (e["start"] - self.origin) * 1e6, "dur": e["duration"] * 1e6, "args": args})
+        # Row names
+        for pid in {event["pid"] for event in events}:
+            name = f"slab {pid}" if pid else "host"
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}})
+            for tool, tid in ROWS.items():
+                events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": tool}})
+        for thread, index in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": len(ROWS) + 1 + index,
+                           "args": {"name": f"sleep (thread {index})"}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -1,18 +1,15 @@
-import pyvisa
 import numpy as np
-import time
 import argparse
 import matplotlib.pyplot as plt
 
-def exisiting_tool(rm, lab_num, tool, socket_num):
-    resource = rm.open_resource(f"TCPIP::nano-slab-{lab_num}-{tool}.uio.no::{socket_num}::SOCKET")
-    resource.read_termination = '\n'
-    if tool != "gpp":
-        resource.write_termination = '\n'
-    print(resource.query('*IDN?'))
-    return resource
+from instruments import Session
+from scpi_batch import Batch
+from chirp import chirp_sweep
+from scaling import ScaleController
+from live_plot import open_live
 
-if __name__ == "__main__":
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Setting a frequency sweep with the MFG and reading it with the MDO")
     parser.add_argument("--slab_num", required=True, type=int, help="Lab space number between 1 and 6")
     parser.add_argument("--mfg_output_port", required=True, type=int, help="MFG output port, 1 or 2")
@@ -22,15 +19,22 @@ if __name__ == "__main__":
     parser.add_argument("--stop_frequency", required=True, type=float, help="Sweep stop frequency")
     parser.add_argument("--sweep_time", required=True, type=float, help="Total sweep duration in seconds")
     parser.add_argument("--amplitude", required=True, type=float, help="Signal amplitude")
-    parser.add_argument("--offset", required=True, type=float, help="Signal offset")    
-    args = parser.parse_args()
+    parser.add_argument("--offset", required=True, type=float, help="Signal offset")
+    parser.add_argument("--chirp", action="store_true", help="Capture one whole sweep and reconstruct the Bode plot locally")
+    parser.add_argument("--points", type=int, default=100, help="Frequency points of the --chirp reconstruction")
+    parser.add_argument("--record_length", type=int, default=1000000, help="Scope record length in --chirp mode")
+    parser.add_argument("--live", action="store_true", help="Plot the points in a window as they are measured")
+    parser.add_argument("--snapshot", action="append", help="Keep this PNG or SVG file up to date with the points measured so far, repeatable, needs no display")
+    parser.add_argument("--sim", nargs="?", const="default", help="Use the simulated bench, optionally configured by a JSON file")
+    return parser
 
-    rm = pyvisa.ResourceManager()
-    rm.list_resources()
 
-    mfg = exisiting_tool(rm, args.slab_num, "mfg", 1026)
-    osc = exisiting_tool(rm, args.slab_num, "mdo", 3000)
+def hardware_sweep(mfg, osc, args, live=None):
+    """Run the MFG log sweep and measure with the MDO until it wraps around.
 
+    Every point also goes to live (live_plot.LivePlot). Returns the lists of input frequency, input amplitude, output frequency,
+    output amplitude and phase shift.
+    """
     # Prepare arrays to store measurements
     in_freq_values = []
     in_amp_values = []
@@ -39,66 +43,106 @@ if __name__ == "__main__":
     phase_shift = []
 
     # Configure the MFG Sweep
-    mfg.write(f'OUTPUT{args.mfg_output_port}:LOAD INF')
-    mfg.write(f'SOURCE{args.mfg_output_port}:APPL:SIN {args.start_frequency},{args.amplitude},{args.offset}')
-    mfg.write(f'SOURCE{args.mfg_output_port}:FREQ:START {args.start_frequency}')
-    mfg.write(f'SOURCE{args.mfg_output_port}:FREQ:STOP {args.stop_frequency}')
-    mfg.write(f'SOURCE{args.mfg_output_port}:SWEEP:SPACING LOG')
-    mfg.write(f'SOURCE{args.mfg_output_port}:SWEEP:TIME {args.sweep_time}')
-    mfg.write(f'SOURCE{args.mfg_output_port}:SWEEP:STATE ON')  # Correct command to start sweep
-    mfg.write(f'OUTPUT{args.mfg_output_port} ON')  # Enable output
-
-    prev_frequency = float('inf')  # Initialize to something higher than max expected frequency
+    with Batch(mfg) as batch:
+        batch.write(f'OUTPUT{args.mfg_output_port}:LOAD INF')
+        batch.write(f'SOURCE{args.mfg_output_port}:APPL:SIN {args.start_frequency},{args.amplitude},{args.offset}')
+        batch.write(f'SOURCE{args.mfg_output_port}:FREQ:START {args.start_frequency}')
+        batch.write(f'SOURCE{args.mfg_output_port}:FREQ:STOP {args.stop_frequency}')
+        batch.write(f'SOURCE{args.mfg_output_port}:SWEEP:SPACING LOG')
+        batch.write(f'SOURCE{args.mfg_output_port}:SWEEP:TIME {args.sweep_time}')
+        batch.write(f'SOURCE{args.mfg_output_port}:SWEEP:STATE ON')  # Correct command to start sweep
+        batch.write(f'OUTPUT{args.mfg_output_port} ON')  # Enable output
+
+    # Scales follow the sweep instead of autoscaling at every point
+    scaler = ScaleController(osc, args.mdo_input_port_in, args.mdo_input_port_out, args.amplitude, args.offset)
+    frequency = args.start_frequency
+    prev_frequency = 0  # The sweep has wrapped around once the frequency drops
     while True:
-        # Wait for autoscale to finish
-        osc.write(':AUTOSet')
-        time.sleep(10)  # Adjust as necessary
+        scaler.set(frequency)
 
+        batch = Batch(osc)
         # Input measurement
-        osc.write(f':CHANnel{args.mdo_input_port_in}:DISPlay ON')
-        osc.write(f':MEASure:SOURce CH{args.mdo_input_port_in}')
-        current_frequency = osc.query(':MEASure:FREQuency?')
-        current_amplitude = osc.query(':measure:amplitude?')
-        
-        in_freq_values.append(current_frequency)
-        in_amp_values.append(current_amplitude)
-        
-        time.sleep(0.5)
+        batch.write(f':CHANnel{args.mdo_input_port_in}:DISPlay ON')
+        batch.write(f':MEASure:SOURce CH{args.mdo_input_port_in}')
+        batch.query(':MEASure:FREQuency?')
+        batch.query(':measure:amplitude?')
 
         # Output measurement
-        osc.write(f':CHANnel{args.mdo_input_port_out}:DISPlay ON')
-        osc.write(f':MEASure:SOURce CH{args.mdo_input_port_out}')
-        
-        current_frequency_out = osc.query(':MEASure:FREQuency?')
-        current_amplitude_out = osc.query(':measure:amplitude?')
-        
-        out_freq_values.append(current_frequency_out)
-        out_amp_values.append(current_amplitude_out)
-        
-        time.sleep(0.5)
+        batch.write(f':CHANnel{args.mdo_input_port_out}:DISPlay ON')
+        batch.write(f':MEASure:SOURce CH{args.mdo_input_port_out}')
+        batch.query(':MEASure:FREQuency?')
+        batch.query(':measure:amplitude?')
 
         # Phase difference measurement:
-        osc.write(f':MEASure:SOURce1 CH{args.mdo_input_port_in}')  # e.g., CH1
-        osc.write(f':MEASure:SOURce2 CH{args.mdo_input_port_out}')  # e.g., CH2
-        
-        current_phase_shift = osc.query('measure:phase?')
-        
-        phase_shift.append(current_phase_shift)
-        print(f'Phase difference: {current_phase_shift}')
+        batch.write(f':MEASure:SOURce1 CH{args.mdo_input_port_in}')  # e.g., CH1
+        batch.write(f':MEASure:SOURce2 CH{args.mdo_input_port_out}')  # e.g., CH2
+        batch.query('measure:phase?')
+        # Input frequency again, SOURce1 is back on the input
+        batch.query(':MEASure:FREQuency?')
+
+        # All of the above in one round trip
+        (current_frequency, current_amplitude,
+         current_frequency_out, current_amplitude_out,
+         current_phase_shift, end_frequency) = batch.send()
 
         # Check if the sweep has completed
-        if float(current_frequency) >= float(prev_frequency):
-            prev_frequency = float(current_frequency)
-        else:
+        if float(current_frequency) < float(prev_frequency):
             break  # Exit the loop if the frequency is lower than the previous
+        if float(end_frequency) < float(current_frequency):
+            break  # The sweep wrapped around during the point, its later readings are of the next sweep
+        frequency = float(current_frequency)
+        # A clipped or under-ranged reading is dropped, the sweep has moved on by the next one
+        if not scaler.check(frequency, float(current_amplitude), float(current_amplitude_out)):
+            continue
+        prev_frequency = frequency
+
+        in_freq_values.append(current_frequency)
+        in_amp_values.append(current_amplitude)
+        out_freq_values.append(current_frequency_out)
+        out_amp_values.append(current_amplitude_out)
+        phase_shift.append(current_phase_shift)
+        if live is not None:
+            # The scope answers '?' when it cannot measure the phase
+            phase = float(current_phase_shift) if current_phase_shift.strip() != '?' else np.nan
+            live.add(frequency, 20 * np.log10(float(current_amplitude_out) / float(current_amplitude)), phase)
+        print(f'Phase difference: {current_phase_shift}')
 
-    print(f'Phase shift: {phase_shift}')
     # Sweep Off
     mfg.write(f'SOURCE{args.mfg_output_port}:FREQ:SWEEP:STATE OFF')
     mfg.write(f'OUTPUT{args.mfg_output_port} OFF')
+    return in_freq_values, in_amp_values, out_freq_values, out_amp_values, phase_shift
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    session = Session(args.slab_num, sim=args.sim)
+    mfg = session.mfg
+    osc = session.mdo
+
+    if args.chirp:
+        frequencies, gain, phase_shift = chirp_sweep(mfg, osc, args, args.points, args.record_length)
+        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
+        ax1.semilogx(frequencies, gain)
+        ax1.set_title('Bode Plot')
+        ax1.set_ylabel('Gain [dB]')
+        ax1.grid(True)
+        ax2.semilogx(frequencies, phase_shift)
+        ax2.set_xlabel('Frequency [Hz]')
+        ax2.set_ylabel('Phase Shift [Degrees]')
+        ax2.grid(True)
+        plt.tight_layout()
+        plt.show()
+        raise SystemExit
+
+    live = open_live(args, "bode")
+    in_freq_values, in_amp_values, out_freq_values, out_amp_values, phase_shift = hardware_sweep(mfg, osc, args, live)
+    if live is not None:
+        live.close()
+    print(f'Phase shift: {phase_shift}')
 
     # Plot or process data
-    plt.plot(in_freq_values, phase_shift, label="Phase Shift")
+    plt.plot([float(f) for f in in_freq_values], [float(p) for p in phase_shift], label="Phase Shift")
     plt.xlabel("Frequency (Hz)")
     plt.ylabel("Phase Shift (degrees)")
     plt.legend()
@@ -1,20 +1,17 @@
-import pyvisa
-import time
 import numpy as np
 import argparse
+import time
+from contextlib import nullcontext
 
-#Checking of tool is available
-def exisiting_tool(lab_num,tool,soccet_num):
-    fung = rm.open_resource("TCPIP::nano-slab-"+str(lab_num)+"-"+tool+".uio.no::"+str(soccet_num)+"::SOCKET")
-    fung.read_termination = '\n'
-    if(tool == "gpp"):
-        pass 
-    else:
-        fung.write_termination = '\n'
-    print(fung.query('*IDN?'))
-    return fung
+from instruments import Session
+from settling import wait_settled
+from results import open_results
+from averaging import collect
+from live_plot import open_live
+from tracing import Tracer
 
-if (__name__ == "__main__"):
+
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Setting a DC voltage with the power supply (gpp) and reading it with the digital multimeter(gdm)"
     )
@@ -23,16 +20,42 @@ if (__name__ == "__main__"):
     parser.add_argument("--voltage_min", required=True, type=float, help="Lower bound for voltage sweep")
     parser.add_argument("--voltage_max", required=True, type=float, help="Upper bound for voltage sweep")
     parser.add_argument("--voltage_step", required=True, type=float, help="Voltage step for votlage sweep")
-    args = parser.parse_args()
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="Readings within this many volts count as settled")
+    parser.add_argument("--settle_timeout", type=float, default=15, help="Maximum settling time per point in seconds")
+    parser.add_argument("--samples", type=int, default=1, help="DMM readings per point, more than 1 reads buffered blocks and reports their statistics")
+    parser.add_argument("--range", default="DEF", help="DMM DC voltage range for --samples, DEF for auto range")
+    parser.add_argument("--rate", default="M", choices=["S", "M", "F"], help="DMM detector rate for --samples: slow, medium or fast")
+    parser.add_argument("--voltage_ci", type=float, help="Read blocks of --samples readings per point until the confidence interval of the mean is within this many volts")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of --voltage_ci")
+    parser.add_argument("--max_readings", type=int, default=200, help="Most DMM readings per point with --voltage_ci")
+    parser.add_argument("--sequence", action="store_true", help="Let the supply step through the setpoints from its list memory, if it has one")
+    parser.add_argument("--dwell", type=float, default=1.0, help="Time per setpoint in seconds in --sequence mode, long enough for the output to settle")
+    parser.add_argument("--output", help="Stream every point to this JSON lines result file")
+    parser.add_argument("--resume", action="store_true", help="Continue the --output file, skipping the points it already has")
+    parser.add_argument("--live", action="store_true", help="Plot the points in a window as they are measured")
+    parser.add_argument("--snapshot", action="append", help="Keep this PNG or SVG file up to date with the points measured so far, repeatable, needs no display")
+    parser.add_argument("--trace", help="Save a Chrome trace of the instrument I/O to this JSON file and print the command latencies")
+    parser.add_argument("--sim", nargs="?", const="default", help="Use the simulated bench, optionally configured by a JSON file")
+    return parser
+
+
+def check_args(parser, args):
+    # In --sequence mode the supply steps on by itself, one DMM reading fits in a dwell
+    if args.sequence and (args.samples > 1 or args.voltage_ci is not None):
+        parser.error("--sequence takes one DMM reading per step, it does not combine with --samples or --voltage_ci")
+
+
+def sweep_values(args):
+    return np.arange(args.voltage_min, args.voltage_max+args.voltage_step*0.45, args.voltage_step) # sweep parameters
+
 
-    #Invoking the resources
-    rm = pyvisa.ResourceManager()
-    rm.list_resources()
-	
-    #Check if tools are available:    
-    dcpp = exisiting_tool(args.slab_num,"gpp",1026)
-    dmm  = exisiting_tool(args.slab_num,"gdm",3001)
+def dc_sweep(dcpp, dmm, args, store=None, live=None):
+    """Step the GPP output through the sweep and read the DMM at each point.
 
+    Points already in store (a results.ResultFile) are not measured again,
+    new ones are appended to it. Every point also goes to live
+    (live_plot.LivePlot). Returns the set and measured voltages.
+    """
     #Setting up the instruments:
     dcpp.write('VSET'+str(args.output_port)+':'+str(args.voltage_min)) #This works
     
@@ -40,21 +63,175 @@ if (__name__ == "__main__"):
     dcpp.write(':output'+str(args.output_port)+':state on')
     
     # DC sweep:
-    set_values = np.arange(args.voltage_min, args.voltage_max+args.voltage_step*0.45, args.voltage_step) # sweep parameters
+    set_values = sweep_values(args)
     meas_values = np.empty(set_values.size)
     print('Number of steps: '+str(set_values.size))
     print(args.output_port)
     
     i = 0
     for x in set_values:
-        dcpp.write('VSET'+str(args.output_port)+':'+str(x))
-        print('Cnt: '+str(i)+' Voltage: '+str(x))
-        time.sleep(10)
-        meas_values[i] = dmm.query('measure:voltage:DC?')
-        time.sleep(5)
+        if store is not None and x in store:
+            #Recorded before the sweep was interrupted
+            meas_values[i] = store.get(x)[0]
+        else:
+            dcpp.write('VSET'+str(args.output_port)+':'+str(x))
+            print('Cnt: '+str(i)+' Voltage: '+str(x))
+            #Wait until the DMM readings stop moving
+            meas_values[i] = wait_settled(dmm.measure_dc, abs_tol=args.tolerance, timeout=args.settle_timeout)
+            if store is not None:
+                store.append(x, (meas_values[i],))
+        if live is not None:
+            live.add(x, meas_values[i])
         i = i + 1
         
     
-    dcpp.write(':output'+str(args.slab_num)+':state off')
+    dcpp.write(':output'+str(args.output_port)+':state off')
+    return set_values, meas_values
+
+
+def buffered_dc_sweep(dcpp, dmm, args, store=None, live=None):
+    """DC sweep reading a block of args.samples DMM readings per point.
+
+    The GDM is configured once and every block is a single INIT/FETCH round
+    trip. Returns the set voltages and the mean, standard deviation and
+    count of the readings at each point.
+    """
+    dmm.configure_dc(args.samples, args.range, args.rate)
+    dcpp.write('VSET'+str(args.output_port)+':'+str(args.voltage_min))
+    dcpp.write(':output'+str(args.output_port)+':state on')
+
+    set_values = sweep_values(args)
+    stats = np.empty((set_values.size, 3))
+    print('Number of steps: '+str(set_values.size))
+    for i, x in enumerate(set_values):
+        if store is not None and x in store:
+            stats[i] = store.get(x)
+        else:
+            dcpp.write('VSET'+str(args.output_port)+':'+str(x))
+            print('Cnt: '+str(i)+' Voltage: '+str(x))
+            #Each block is already an average, two agreeing blocks count as settled
+            stats[i] = wait_settled(dmm.acquire, abs_tol=args.tolerance, count=2, timeout=args.settle_timeout,
+                                    key=lambda block: block[0])
+            if store is not None:
+                store.append(x, stats[i])
+        if live is not None:
+            live.add(x, stats[i, 0])
+
+    dcpp.write(':output'+str(args.output_port)+':state off')
+    return set_values, stats[:, 0], stats[:, 1], stats[:, 2]
+
+
+def confident_dc_sweep(dcpp, dmm, args, store=None, live=None):
+    """DC sweep reading blocks of args.samples DMM readings per point until
+    the mean is known to within args.voltage_ci at args.confidence.
+
+    Noisy points get more blocks, quiet ones stop early. Returns the set
+    voltages and the mean, standard deviation, count and confidence
+    interval half width at each point.
+    """
+    dmm.configure_dc(args.samples, args.range, args.rate)
+    dcpp.write('VSET'+str(args.output_port)+':'+str(args.voltage_min))
+    dcpp.write(':output'+str(args.output_port)+':state on')
+
+    set_values = sweep_values(args)
+    stats = np.empty((set_values.size, 4))
+    print('Number of steps: '+str(set_values.size))
+    for i, x in enumerate(set_values):
+        if store is not None and x in store:
+            stats[i] = store.get(x)
+        else:
+            dcpp.write('VSET'+str(args.output_port)+':'+str(x))
+            #Only readings taken after the output settled count towards the mean
+            wait_settled(dmm.acquire, abs_tol=args.tolerance, count=2, timeout=args.settle_timeout, key=lambda block: block[0])
+            estimate = collect(lambda: dmm.readings()[:, None], (args.voltage_ci,), args.confidence,
+                               min_count=max(args.samples, 3), max_count=args.max_readings)
+            stats[i] = estimate.mean[0], estimate.std[0], estimate.count, estimate.ci[0]
+            print('Cnt: '+str(i)+' Voltage: '+str(x)+' Measured: '+f'{stats[i, 0]:.6g} +- {stats[i, 3]:.2g} ({estimate.count} readings)')
+            if store is not None:
+                store.append(x, stats[i])
+        if live is not None:
+            live.add(x, stats[i, 0])
+
+    dcpp.write(':output'+str(args.output_port)+':state off')
+    return set_values, stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3]
+
+
+# Fraction of the dwell after which a sequenced step is read, late enough to have settled
+READ_AT = 0.8
+
+
+def sequenced_dc_sweep(dcpp, dmm, args, store=None, live=None):
+    """DC sweep stepped by the supply itself from an uploaded setpoint list.
+
+    The DMM is read near the end of every dwell, timed from the trigger, so
+    nothing is sent to the supply during the sweep. Falls back to dc_sweep()
+    when the supply does not take a list. Returns the set and measured
+    voltages.
+    """
+    set_values = sweep_values(args)
+    todo = [x for x in set_values if store is None or x not in store]
+    dcpp.write('VSET'+str(args.output_port)+':'+str(args.voltage_min))
+    if todo and not dcpp.upload_list(args.output_port, todo, args.dwell):
+        print('The supply does not take a setpoint list, stepping from Python')
+        return dc_sweep(dcpp, dmm, args, store, live)
+
+    dcpp.write(':output'+str(args.output_port)+':state on')
+    print('Number of steps: '+str(len(todo)))
+    measured = {}
+    if todo:
+        dcpp.start_list()
+        start = time.perf_counter()
+        for i, x in enumerate(todo):
+            delay = start + (i + READ_AT) * args.dwell - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > (1 - READ_AT) * args.dwell:
+                print('Cnt: '+str(i)+' read after the supply moved on, increase --dwell')
+            measured[x] = dmm.measure_dc()
+            if store is not None:
+                store.append(x, (measured[x],))
+            if live is not None:
+                live.add(x, measured[x])
+        dcpp.stop_list(args.output_port)
+
+    dcpp.write(':output'+str(args.output_port)+':state off')
+    meas_values = np.array([measured[x] if x in measured else store.get(x)[0] for x in set_values])
+    return set_values, meas_values
+
+
+def main(args):
+    #Check if tools are available:
+    tracer = Tracer() if args.trace else None
+    session = Session(args.slab_num, sim=args.sim, tracer=tracer)
+    dcpp = session.gpp
+    dmm  = session.gdm
+
+    with tracer.sleeps() if tracer else nullcontext():
+        live = open_live(args, "dc")
+        if args.voltage_ci is not None:
+            store = open_results(args, ("set", "mean", "std", "count", "ci"), session)
+            set_values, meas_values, meas_std, meas_count, meas_ci = confident_dc_sweep(dcpp, dmm, args, store, live)
+            print(meas_ci)
+        elif args.samples > 1:
+            store = open_results(args, ("set", "mean", "std", "count"), session)
+            set_values, meas_values, meas_std, meas_count = buffered_dc_sweep(dcpp, dmm, args, store, live)
+            print(meas_std)
+        else:
+            store = open_results(args, ("set", "measured"), session)
+            sweep = sequenced_dc_sweep if args.sequence else dc_sweep
+            set_values, meas_values = sweep(dcpp, dmm, args, store, live)
+    if store is not None:
+        store.close()
+    if live is not None:
+        live.close()
+    if tracer:
+        tracer.report()
+        tracer.save(args.trace)
     print(meas_values)
-    
+
+
+if (__name__ == "__main__"):
+    parser = build_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    main(args)
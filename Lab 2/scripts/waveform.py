@@ -0,0 +1,90 @@
+from collections import namedtuple
+
+import numpy as np
+
+# ADC counts per vertical division in the MDO waveform memory
+COUNTS_PER_DIV = 25
+
+Waveform = namedtuple("Waveform", "time volts preamble")
+
+
+def read_block(resource, chunk=256):
+    """Read a '<preamble>#<n><length><data>' reply from the socket.
+
+    Returns the preamble text and a view of the binary data without
+    copying it.
+    """
+    buf = bytearray()
+    while True:
+        buf += resource.read_bytes(chunk, break_on_termchar=False)
+        start = buf.find(b'#')
+        if start >= 0 and len(buf) > start + 1 and len(buf) >= start + 2 + int(buf[start+1:start+2]):
+            break
+    digits = int(buf[start+1:start+2])
+    length = int(buf[start+2:start+2+digits])
+    data_start = start + 2 + digits
+    missing = data_start + length - len(buf)
+    if missing > 0:
+        buf += resource.read_bytes(missing, break_on_termchar=False)
+    if len(buf) == data_start + length:
+        # Consume the termination after the block
+        resource.read_bytes(1, break_on_termchar=False)
+    preamble = buf[:start].decode(errors="replace")
+    return preamble, memoryview(buf)[data_start:data_start+length]
+
+
+def parse_preamble(text):
+    preamble = {}
+    for item in text.strip().split(';'):
+        key, _, value = item.partition(',')
+        if key:
+            preamble[key.strip()] = value.strip()
+    return preamble
+
+
+def decode(preamble, data):
+    counts = np.frombuffer(data, dtype='>i2')
+    volts = counts * (float(preamble["Vertical Scale"]) / COUNTS_PER_DIV)
+    dt = float(preamble["Sampling Period"])
+    # Time zero is the trigger point in the middle of the record
+    time = (np.arange(counts.size) - counts.size / 2) * dt + float(preamble.get("Horizontal Position", 0))
+    return Waveform(time, volts, preamble)
+
+
+def set_record_length(osc, record_length):
+    osc.write(f':ACQuire:RECOrdlength {record_length:d}')
+
+
+def read_channel(osc, channel):
+    osc.write(f':ACQuire{channel}:MEMory?')
+    text, data = read_block(osc.resource)
+    return decode(parse_preamble(text), data)
+
+
+def stop(osc, record_length=None):
+    """Stop the scope on a fresh sample mode acquisition.
+
+    Its memory then holds that acquisition until read_stopped() restarts it,
+    so the signal can already change while the channels are read out.
+    """
+    osc.write(':ACQuire:MODe SAMPle')
+    if record_length is not None:
+        set_record_length(osc, record_length)
+    osc.write(':STOP')
+
+
+def read_stopped(osc, channels=(1, 2)):
+    try:
+        return [read_channel(osc, channel) for channel in channels]
+    finally:
+        osc.write(':RUN')
+
+
+def capture(osc, channels=(1, 2), record_length=None):
+    """Capture the waveform memory of the given channels.
+
+    The scope is stopped while reading so all channels come from the same
+    acquisition. Returns one Waveform per channel.
+    """
+    stop(osc, record_length)
+    return read_stopped(osc, channels)